@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+
+import hashlib
+import inspect
+import json
+import os
+import time
+from csgo_wp.storage import (save_tensors, append_tensors, tensors_exist,
+                             load_tensors, load_column)
+
+
+def _source(fn):
+    try:
+        return inspect.getsource(fn)
+    except (TypeError, OSError):
+        # builtins, partials, functions defined in a REPL...
+        return repr(fn)
+
+
+def file_fingerprint(file_loc):
+    # cheap stand-in for the contents: rewriting a file changes its mtime
+    if not os.path.exists(file_loc):
+        return 'missing'
+
+    stat = os.stat(file_loc)
+
+    return f'{stat.st_size}-{stat.st_mtime_ns}'
+
+
+def split_fingerprint(folder):
+    # raw split written by storage.save_split
+    digest = hashlib.sha256()
+
+    for name in sorted(os.listdir(folder)):
+        file_loc = os.path.join(folder, name)
+
+        if name in ['columns.json', 'round_offsets.npy']:
+            with open(file_loc, 'rb') as f:
+                digest.update(f.read())
+        else:
+            digest.update(f'{name}:{file_fingerprint(file_loc)}'.encode())
+
+    return digest.hexdigest()
+
+
+def cache_key(transform, game_map,
+              params=None, dependencies=(), map_fingerprint=''):
+    # changes whenever the code of the transform (or of the functions it
+    # relies on), its parameters or the map change. the raw split is checked
+    # shard by shard against the manifest, see TransformCache.shards
+    description = {'transform': transform.__name__,
+                   'version': getattr(transform, 'version', None),
+                   'sources': [_source(fn)
+                               for fn in (transform,) + tuple(dependencies)],
+                   'params': params or {},
+                   'map': game_map,
+                   'map_fingerprint': map_fingerprint,
+                   }
+
+    encoded = json.dumps(description, sort_keys=True, default=str)
+
+    return hashlib.sha256(encoded.encode()).hexdigest()[:20]
+
+
+class TransformCache:
+    # transformed tensors of one split, one entry per cache key, with a
+    # manifest recording what each entry was built from: the raw shards (and
+    # their matches) in the order their samples were appended. least
+    # recently used entries beyond max_entries are deleted
+
+    def __init__(self, folder, max_entries=4):
+        self.folder = folder
+        self.max_entries = max_entries
+        self.manifest_loc = os.path.join(folder, 'manifest.json')
+
+        os.makedirs(folder, exist_ok=True)
+
+    def _read_manifest(self):
+        if not os.path.exists(self.manifest_loc):
+            return {}
+
+        with open(self.manifest_loc) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        # one tmp file per process, readers may bump last_used concurrently
+        tmp_loc = f'{self.manifest_loc}.{os.getpid()}.tmp'
+
+        with open(tmp_loc, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        os.replace(tmp_loc, self.manifest_loc)
+
+    def location(self, key):
+        return os.path.join(self.folder, key)
+
+    def __contains__(self, key):
+        return key in self._read_manifest() and tensors_exist(
+            self.location(key))
+
+    def load(self, key):
+        manifest = self._read_manifest()
+        manifest[key]['last_used'] = time.time()
+
+        # only used to pick what to evict, not worth failing a read over,
+        # e.g. on a read-only mount
+        try:
+            self._write_manifest(manifest)
+        except OSError:
+            pass
+
+        # samples past n_samples are from an append that was interrupted
+        # before the manifest was written
+        n_samples = manifest[key]['n_samples']
+
+        return tuple(tensor[:n_samples]
+                     for tensor in load_tensors(self.location(key)))
+
+    def load_column(self, key, name):
+        n_samples = self._read_manifest()[key]['n_samples']
+
+        return load_column(self.location(key), name)[:n_samples]
+
+    def shards(self, key):
+        # shards the entry was built from, None if there is no entry
+        if key not in self:
+            return None
+
+        return self._read_manifest()[key].get('shards')
+
+    def save(self, key, data, targets, shard, info=None, columns=None):
+        # a rebuild starts from nothing, files derived from the previous
+        # tensors (e.g. the compact encoding) would be stale
+        self._remove_files(key)
+        save_tensors(data, targets, self.location(key), columns)
+
+        manifest = self._read_manifest()
+        manifest[key] = {'info': info or {},
+                         'created': time.time(),
+                         'last_used': time.time(),
+                         'n_samples': data.shape[0],
+                         'shards': [dict(shard, samples=[0, data.shape[0]])],
+                         }
+
+        self._evict(manifest)
+        self._write_manifest(manifest)
+
+    def append(self, key, data, targets, shard, columns=None):
+        manifest = self._read_manifest()
+        entry = manifest[key]
+
+        # the header is written before the manifest, a crash in between
+        # leaves samples the manifest doesn't know about
+        append_tensors(data, targets, self.location(key), columns,
+                       n_samples=entry['n_samples'])
+
+        start = entry['n_samples']
+        entry['n_samples'] += data.shape[0]
+        entry['last_used'] = time.time()
+        entry['shards'].append(dict(shard, samples=[start,
+                                                    entry['n_samples']]))
+
+        self._write_manifest(manifest)
+
+    def _evict(self, manifest):
+        by_age = sorted(manifest, key=lambda k: manifest[k]['last_used'])
+
+        for key in by_age[:max(len(manifest) - self.max_entries, 0)]:
+            del manifest[key]
+            self._remove_files(key)
+
+    def _remove_files(self, key):
+        # header, tensors, extra columns, compact encoding...
+        for name in os.listdir(self.folder):
+            if name.startswith(f'{key}.'):
+                os.remove(os.path.join(self.folder, name))
@@ -1,98 +1,71 @@
 #! /usr/bin/python3
 
-from csgo.analytics.distance import area_distance
+import os
 import time
-import queue
-
-
-def calc_area_distance(params_q, distances_q):
-    while True:
-        try:
-            params = params_q.get(timeout=5)
-        except queue.Empty:
-            print('Params queue empty')
-            break
-
-        distance = area_distance(params['map'], params['a1'], params['a2'])
-
-        distances_q.put((params['map'], params['a1'], params['a2'], distance))
-
-    return
-
-
-def write_distances(q, count):
-    from os import path
-
-    written = 0
-    start_time = time.time()
-
-    # one folder up, into the 'data' folder
-    current_dir = path.dirname(path.abspath(__file__))
-    file_loc = path.join(current_dir, 'data', 'distance_infos.csv')
-
-    colnames = ['map', 'areaId_1', 'areaId_2', 'graph_distance']
-
-    with open(file_loc, 'w') as f:
-        f.write(','.join(colnames) + '\n')
-
-        time.sleep(3)
-        while written < (899 * 899):
-            try:
-                infos = q.get(timeout=5)
-            except queue.Empty:
-                print('    Distances queue empty!    ')
-                time.sleep(30)
-                continue
-            print(infos)
-            f.write(','.join(map(str, infos)) + '\n')
-            written += 1
-            if written % 1000 == 0:
-                print(f'\rCalculated {written}/{count.value} in '
-                      f'{time.time() - start_time}')
-
-        print('exiting write_distances')
-    return
+from csgo_wp.distance_table import build_map_table, table_location
 
 
 if __name__ == '__main__':
-    import multiprocessing
-    import sys
-
-    params = multiprocessing.Queue()
-    distances = multiprocessing.Queue()
-
-    count = multiprocessing.Value('i', 0)
-
-    if sys.argv[1] == 'mirage':
-        for i in range(1, 900):
-            for j in range(1, 900):
-                params.put({'map': 'de_mirage',
-                            'a1': i,
-                            'a2': j,
-                            })
-    elif sys.argv[1] == 'dust2':
-        for i in range(1, 900):
-            for j in range(1, 900):
-                params.put({'map': 'de_dust2',
-                            'a1': i,
-                            'a2': j,
-                            })
-
-    procs = {}
-
-    for p in range(0, 10):
-        procs[p] = multiprocessing.Process(target=calc_area_distance,
-                                           args=(params,
-                                                 distances,
-                                                 ))
-        procs[p].start()
-
-    # initialize writer
-    p2 = multiprocessing.Process(target=write_distances,
-                                 args=(distances, count))
-    p2.start()
-
-    for p in range(0, 10):
-        procs[p].join()
-
-    p2.join()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    # e.g. dust2 mirage, or de_dust2 de_mirage
+    parser.add_argument('maps',
+                        type=str,
+                        nargs='+',
+                        )
+
+    parser.add_argument('--workers',
+                        type=int,
+                        default=os.cpu_count(),
+                        )
+
+    # edge attribute to sum along paths, numbers of hops by default
+    parser.add_argument('--weight',
+                        type=str,
+                        default=None,
+                        )
+
+    parser.add_argument('--checkpoint-seconds',
+                        type=float,
+                        default=60,
+                        )
+
+    # rows per work unit sent to a worker
+    parser.add_argument('--sources-per-task',
+                        type=int,
+                        default=32,
+                        )
+
+    parser.add_argument('--report-seconds',
+                        type=float,
+                        default=5,
+                        )
+
+    # ignore the rows saved by an interrupted run
+    parser.add_argument('--restart',
+                        action='store_true',
+                        )
+
+    args = parser.parse_args()
+
+    for game_map in args.maps:
+        if not game_map.startswith('de_'):
+            game_map = f'de_{game_map}'
+
+        start_time = time.time()
+
+        print(f'Calculating distances for {game_map}...')
+        table = build_map_table(game_map,
+                                weight=args.weight,
+                                num_workers=args.workers,
+                                checkpoint_seconds=args.checkpoint_seconds,
+                                restart=args.restart,
+                                sources_per_task=args.sources_per_task,
+                                verbose=True,
+                                report_seconds=args.report_seconds,
+                                )
+
+        print(f'Saved {table.shape} table to {table_location(game_map)} in '
+              f'{time.time() - start_time:.1f}s')
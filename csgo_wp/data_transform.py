@@ -1,28 +1,38 @@
 #! /usr/bin/env python3
 
 import torch
-from csgo.analytics.distance import point_distance, area_distance
+from concurrent.futures import ProcessPoolExecutor
 from functools import partial
 import os
-import pandas as pd
-from collections import defaultdict
+import itertools
+from collections import defaultdict, deque
 import pickle
+import json
 import numpy as np
-
-
-def euclidean_distance(x, game_map):
-    return point_distance(x.values[0][0],
-                          x.values[0][1],
-                          map=game_map,
-                          type='euclidean',
-                          )
+from csgo_wp.distance_table import (get_distance_table, table_location,
+                                    lookup_distances, MAX_TABLES)
+from csgo_wp.ingest import (stream_rounds, load_outcomes, round_targets,
+                            split_for_value, match_split, frames_location,
+                            rounds_location, select_ticks, tick_columns)
+from csgo_wp.storage import (save_split, split_exists, RawSplit,
+                             ShardedSplit, shard_folders, next_shard_folder,
+                             TensorBuffer)
+from csgo_wp.cache import (TransformCache, cache_key, split_fingerprint,
+                           file_fingerprint)
+from csgo_wp.features import (round_to_arrays, unsorted_features,
+                              multichannel_features, nfl_features,
+                              unsorted_columns, multichannel_columns,
+                              nfl_columns, NFL_ATTRIBUTES, encode_unsorted,
+                              decode_unsorted, encode_multichannel,
+                              decode_multichannel, encode_nfl, decode_nfl,
+                              euclidean_distances, pairwise_differences,
+                              _position_columns, _distance_matrices)
 
 
 def area_dist_all(x, game_map):
-    return area_distance(area_one=x.values[0][0],
-                         area_two=x.values[0][1],
-                         map=game_map,
-                         )
+    table = get_distance_table(game_map)
+
+    return table[x.values[0][0], x.values[0][1]]
 
 
 def attr_diff(x):
@@ -37,7 +47,8 @@ def is_ct(x):
     return x == 'CT'
 
 
-def transform_data(df, game_map):
+def transform_data_reference(df, game_map):
+    # original pivot-based implementation, kept to check the vectorized one
     df.drop_duplicates(inplace=True)
 
     for c in ['X', 'Y', 'Z']:
@@ -90,7 +101,8 @@ def transform_data(df, game_map):
     return result
 
 
-def transform_multichannel(df, game_map):
+def transform_multichannel_reference(df, game_map):
+    # original pivot-based implementation, kept to check the vectorized one
     df.drop_duplicates(inplace=True)
 
     for c in ['X', 'Y', 'Z']:
@@ -179,8 +191,30 @@ def transform_multichannel(df, game_map):
     return result
 
 
-def transform_nfl(df, game_map):
+def transform_data(df, game_map):
+    values, steam_ids = round_to_arrays(df, unsorted_columns())
+
+    return unsorted_features(values, steam_ids, game_map)
+
+
+def transform_multichannel(df, game_map, distances='area'):
+    # distances: 'area', 'euclidean' or 'both', see features.DISTANCES
+    values, steam_ids = round_to_arrays(df, multichannel_columns(distances))
 
+    return multichannel_features(values, steam_ids, game_map, distances)
+
+
+def transform_nfl(df, game_map, attributes=NFL_ATTRIBUTES, distances='area'):
+    # one CT minus T channel per attribute, plus distances and a T minus CT
+    # channel for the first attribute
+    values, steam_ids = round_to_arrays(df, nfl_columns(attributes,
+                                                        distances))
+
+    return nfl_features(values, steam_ids, game_map, attributes, distances)
+
+
+def transform_nfl_reference(df, game_map):
+    # original pivot-based implementation, kept to check the vectorized one
     df.drop_duplicates(inplace=True)
 
     for c in ['X', 'Y', 'Z']:
@@ -294,6 +328,244 @@ def transform_nfl(df, game_map):
     return result
 
 
+# transforms that can run on the compact arrays from round_to_arrays, so
+# worker processes don't need to be sent whole DataFrames. both functions
+# take the transform's options (e.g. distances)
+ARRAY_TRANSFORMS = {'transform_data': (unsorted_columns, unsorted_features),
+                    'transform_multichannel': (multichannel_columns,
+                                               multichannel_features),
+                    'transform_nfl': (nfl_columns, nfl_features),
+                    }
+
+
+# compact storage (see CSGODataset's compact option): encoder, decoder
+COMPACT_CODECS = {'transform_data': (encode_unsorted, decode_unsorted),
+                  'transform_multichannel': (encode_multichannel,
+                                             decode_multichannel),
+                  'transform_nfl': (encode_nfl, decode_nfl),
+                  }
+
+
+# helpers the ARRAY_TRANSFORMS features call
+FEATURE_HELPERS = (_position_columns, _distance_matrices, lookup_distances,
+                   euclidean_distances, pairwise_differences)
+
+
+def transform_dependencies(transform):
+    # functions whose code also decides what a transform outputs
+    if transform.__name__ in ARRAY_TRANSFORMS:
+        return ((round_to_arrays,) + ARRAY_TRANSFORMS[transform.__name__]
+                + FEATURE_HELPERS)
+
+    return ()
+
+
+def _init_worker(game_maps):
+    # one process per core already, avoid oversubscribing
+    torch.set_num_threads(1)
+
+    for game_map in list(dict.fromkeys(game_maps))[:MAX_TABLES]:
+        get_distance_table(game_map)
+
+
+def _apply(transform, columns, game_round, game_map):
+    # columns: those of round_to_arrays for the array transforms, None for
+    # the ones that take the DataFrame
+    if columns is None:
+        return transform(game_round, game_map)
+
+    return transform(*round_to_arrays(game_round, columns), game_map)
+
+
+def _transform_frames(transform, columns, chunk):
+    # chunk: (round, map) pairs
+    return [_apply(transform, columns, game_round, game_map)
+            for game_round, game_map in chunk]
+
+
+def _transform_stored(transform, columns, folder, chunk):
+    # chunk: (index, ticks to keep or None, map) of rounds of the RawSplit at
+    # folder, read here from its memory-mapped columns so that only indices
+    # are sent to the worker
+    raw_split = RawSplit(folder)
+    results = []
+
+    for idx, round_ticks, game_map in chunk:
+        game_round = raw_split[idx]
+
+        if round_ticks is not None:
+            game_round = game_round[game_round['Tick'].isin(round_ticks)]
+
+        results.append(_apply(transform, columns, game_round, game_map))
+
+    return results
+
+
+def _chunks(items, chunk_size):
+    items = iter(items)
+
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def ordered_results(executor, fn, chunks, max_pending):
+    # fn(chunk) for every chunk, in order, with at most max_pending chunks
+    # submitted ahead of the one being waited for, so chunks are only
+    # produced as fast as the workers go through them
+    pending = deque()
+
+    for chunk in chunks:
+        pending.append(executor.submit(fn, chunk))
+
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+
+    while pending:
+        yield pending.popleft().result()
+
+
+def _keep_ticks(rounds, ticks):
+    for game_round, round_ticks in zip(rounds, ticks):
+        yield game_round[game_round['Tick'].isin(round_ticks)]
+
+
+def transform_rounds(rounds, transform, game_maps, ticks=None, options=None,
+                     num_workers=0, chunk_size=64, verbose=False):
+    # yields one tensor per round, in the same order as rounds, as soon as
+    # it is ready. game_maps has the map of every round, each round is
+    # transformed with its own map's distance table. ticks, if given, has
+    # the ticks of every round to keep (see ingest.select_ticks). options
+    # are passed on to the transform as keyword arguments. with workers,
+    # rounds of a RawSplit are read by the workers themselves, other rounds
+    # are sent to them chunk_size at a time, with at most 2 chunks per worker
+    # in flight
+    len_data = len(rounds)
+    options = options or {}
+
+    if num_workers < 2:
+        if ticks is not None:
+            rounds = _keep_ticks(rounds, ticks)
+
+        for idx, (game_round, game_map) in enumerate(zip(rounds, game_maps)):
+            if verbose:
+                print(f'\rTransforming {idx + 1}/{len_data}', end='')
+            yield transform(game_round, game_map, **options)
+
+        return
+
+    columns = None
+
+    if transform.__name__ in ARRAY_TRANSFORMS:
+        columns, transform = ARRAY_TRANSFORMS[transform.__name__]
+        columns = columns(**options)
+
+    transform = partial(transform, **options)
+
+    if isinstance(rounds, RawSplit):
+        task = partial(_transform_stored, transform, columns, rounds.folder)
+        items = zip(range(len_data),
+                    ticks if ticks is not None else itertools.repeat(None),
+                    game_maps)
+    else:
+        task = partial(_transform_frames, transform, columns)
+
+        if ticks is not None:
+            rounds = _keep_ticks(rounds, ticks)
+
+        items = zip(rounds, game_maps)
+
+    # euclidean distances only don't need any table
+    preload = [] if options.get('distances') == 'euclidean' else game_maps
+
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=num_workers,
+                             initializer=_init_worker,
+                             initargs=(tuple(preload),)) as executor:
+        for result in ordered_results(executor, task,
+                                      _chunks(items, chunk_size),
+                                      2 * num_workers):
+            done += len(result)
+
+            if verbose:
+                print(f'\rTransformed {done}/{len_data}', end='')
+
+            yield from result
+
+
+def append_matches(folder, file_loc, chunk_size=1_000_000):
+    # adds the matches in file_loc that aren't part of any split yet as new
+    # raw shards. they are transformed (on their own) the next time a
+    # CSGODataset is opened on folder
+    known = set()
+
+    for split in ['train', 'val', 'test']:
+        for shard_loc in shard_folders(f'{folder}{split}'):
+            known.update(key[:2] for key in RawSplit(shard_loc).keys())
+
+    new_rounds = defaultdict(list)
+    bad_round_count = 0
+
+    for game_round, is_valid in stream_rounds(file_loc, chunk_size):
+        combo = (game_round['MatchId'].values[0],
+                 game_round['MapName'].values[0])
+
+        if combo in known:
+            continue
+
+        if not is_valid:
+            bad_round_count += 1
+            continue
+
+        new_rounds[match_split(*combo)].append(game_round)
+
+    print(f'Found {bad_round_count} rounds with fewer than 10 players')
+
+    for split, rounds in new_rounds.items():
+        shard_loc = next_shard_folder(f'{folder}{split}')
+        save_split(rounds, shard_loc)
+
+        print(f'Appended {len(rounds)} rounds to {shard_loc}')
+
+    return {split: len(rounds) for split, rounds in new_rounds.items()}
+
+
+def check_tick_columns(raw_split, tick_selection):
+    # fails up front if the rounds lack a column the tick selection needs
+    missing = [name for name in tick_columns(**tick_selection)
+               if name not in raw_split.column_info]
+
+    if missing:
+        raise ValueError(f'{raw_split.folder} has no {", ".join(missing)} '
+                         f'column, needed for tick_selection {tick_selection}'
+                         '. Rebuild the split (delete it and the '
+                         'transformed data next to it) to select ticks '
+                         'this way')
+
+
+def dataset_maps(folder, maps=None):
+    # maps of the rounds in a dataset folder, in the order of their map
+    # index. recorded in maps.json when the splits are built, folders from
+    # before multi-map support only have de_dust2
+    pool_loc = f'{folder}maps.json'
+
+    if not os.path.exists(pool_loc):
+        return list(maps) if maps is not None else ['de_dust2']
+
+    with open(pool_loc) as f:
+        built = json.load(f)
+
+    if maps is not None and list(maps) != built:
+        raise ValueError(f'{folder} was built for maps {built}, not {maps}')
+
+    return built
+
+
 class CSGODataset(torch.utils.data.Dataset):
 
     def __init__(self,
@@ -301,7 +573,13 @@ class CSGODataset(torch.utils.data.Dataset):
                  transform=None,
                  dataset_split='train',
                  verbose=False,
-                 rng_seed=13):
+                 rng_seed=13,
+                 num_workers=0,
+                 chunk_size=1_000_000,
+                 compact=False,
+                 maps=None,
+                 tick_selection=None,
+                 transform_options=None):
         self.rng_seed = rng_seed
         torch.manual_seed(rng_seed)
         np.random.seed(rng_seed)
@@ -313,186 +591,435 @@ class CSGODataset(torch.utils.data.Dataset):
         if transform is None:
             raise ValueError('Transform required')
 
+        # every sample's map is self.maps[self.map_index[idx]], its tick
+        # self.ticks[idx]
+        self.maps = dataset_maps(folder, maps)
+
+        # e.g. {'stride': 4}, {'seconds': 0.5} or {'on_change': True}, see
+        # ingest.select_ticks
+        self.tick_selection = tick_selection or {}
+
+        # keyword arguments of the transform, e.g. {'distances': 'both'}
+        self.transform_options = transform_options or {}
+
         if not os.path.exists(folder + 'test'):
             print('Train/val/test splits not found')
 
-            self.file_loc = folder + 'csgo_playerframes_dust2.csv'
-
-            print('Loading entire dataframe into memory...')
-
-            frames_columns = ['MatchId',
-                              'MapName',
-                              'RoundNum',
-                              'Tick',
-                              'Second',
-                              'PlayerId',
-                              'PlayerSteamId',
-                              'TeamId',
-                              'Side',
-                              'X',
-                              'Y',
-                              'Z',
-                              'ViewX',
-                              'ViewY',
-                              'AreaId',
-                              'Hp',
-                              'Armor',
-                              'IsAlive',
-                              'IsFlashed',
-                              'IsAirborne',
-                              'IsDucking',
-                              'IsScoped',
-                              'IsWalking',
-                              'EqValue',
-                              'HasHelmet',
-                              'HasDefuse',
-                              'DistToBombsiteA',
-                              'DistToBombsiteB',
-                              'Created',
-                              'Updated']
-
-            # only load required columns in
-            df = pd.read_csv(self.file_loc,
-                             names=frames_columns,
-                             usecols=['MatchId',
-                                      'MapName',
-                                      'RoundNum',
-                                      'Tick',
-                                      'PlayerSteamId',
-                                      'X',
-                                      'Y',
-                                      'Z',
-                                      'AreaId',
-                                      'IsAlive',
-                                      'Side',
-                                      'Hp',
-                                      'Armor',
-                                      'EqValue',
-                                      'DistToBombsiteA',
-                                      'DistToBombsiteB',
-                                      ])
-
-            print('Getting match/map combinations...')
-            # list of lists
-            match_map_combos = (df[['MatchId',
-                                    'MapName',
-                                    ]].drop_duplicates()
-                                      .values.tolist())
+            # one file per map, all going into the same splits
+            self.file_locs = [frames_location(folder, game_map)
+                              for game_map in self.maps]
+
+            print('Streaming frames in chunks...')
 
             splits = defaultdict(list)
+            match_splits = {}
+
+            for file_loc in self.file_locs:
+                for game_round, is_valid in stream_rounds(file_loc,
+                                                          chunk_size):
+                    combo = (game_round['MatchId'].values[0],
+                             game_round['MapName'].values[0])
 
-            print('Dropping bogus rounds...')
-            for combo in match_map_combos:
-                value = torch.rand(1).item()
-
-                if value > 0.8:
-                    split = 'test'
-                elif value < 0.6:
-                    split = 'train'
-                else:
-                    split = 'val'
-
-                subset = df[(df['MatchId'] == combo[0])
-                            & (df['MapName'] == combo[1])].copy()
-
-                for round_num in subset['RoundNum'].unique():
-                    game_round = subset[subset['RoundNum'] == round_num]
-                    player_counts = (game_round.groupby('Side')
-                                               .agg({'PlayerSteamId': 'nunique'
-                                                     })
-                                     )
-                    tick_count = game_round['Tick'].nunique()
-                    tick_x_players = player_counts.sum().item() * tick_count
-
-                    if ((player_counts != 5).any().item()
-                       or game_round.shape[0] != tick_x_players):
+                    # same draws, in the same order, as going through the
+                    # match/map combinations in order of appearance
+                    if combo not in match_splits:
+                        match_splits[combo] = split_for_value(
+                            torch.rand(1).item())
+
+                    if not is_valid:
                         # if we have more/less than 5 players per side,
                         # ignore this df. hopefully this doesn't affect the
                         # train/test split ratio too much
                         bad_round_count += 1
-                        # drop the rows with the bogus round
                         continue
 
-                    splits[split].append(game_round)
+                    splits[match_splits[combo]].append(game_round)
 
             print(f'Found {bad_round_count} rounds with fewer than 10 players')
 
-            os.makedirs(folder + 'train')
-            os.makedirs(folder + 'val')
-            os.makedirs(folder + 'test')
+            for split in ['train', 'val', 'test']:
+                save_split(splits[split], f'{folder}{split}/frames')
 
-            for k, v in splits.items():
-                with open(folder + k + f'/{k}.pckl', 'wb') as f:
-                    pickle.dump(v, f)
+            with open(f'{folder}maps.json', 'w') as f:
+                json.dump(self.maps, f)
 
-            self.raw_data = splits[self.split]
             del splits
         else:
-            with open(f'{folder}{self.split}/{self.split}.pckl',
-                      'rb') as f:
-                self.raw_data = pickle.load(f)
+            for split in ['train', 'val', 'test']:
+                legacy_loc = f'{folder}{split}/{split}.pckl'
+
+                # splits written before the columnar format
+                if (not split_exists(f'{folder}{split}/frames')
+                   and os.path.exists(legacy_loc)):
+                    print(f'Converting {legacy_loc}...')
+                    with open(legacy_loc, 'rb') as f:
+                        save_split(pickle.load(f), f'{folder}{split}/frames')
+
+        shards = shard_folders(f'{folder}{self.split}')
+        self.raw_data = ShardedSplit(shards)
 
         self.transform = transform
         transform_name = self.transform.__name__
-        self.data = []
-        self.targets = []
-
-        if not os.path.exists(os.path.join(folder,
-                                           'test',
-                                           f'{transform_name}.pckl')):
-
-            self.rounds = pd.read_csv(folder + 'csgo_rounds_dust2.csv',
-                                      usecols=['MatchId',
-                                               'MapName',
-                                               'RoundNum',
-                                               'WinningSide',
-                                               ])
-
-            print('Transforming raw data...')
-
-            len_data = len(self.raw_data)
-
-            for idx, game_round in enumerate(self.raw_data):
-                match_id = game_round['MatchId'].values[0]
-                map_name = game_round['MapName'].values[0]
-                round_num = game_round['RoundNum'].values[0]
-
-                if verbose:
-                    print(f'\rTransforming {idx +1}/{len_data}: {match_id}, '
-                          f'{map_name}, {round_num}  ', end='')
-                transformed = self.transform(game_round, 'de_dust2')
-                self.data.extend(transformed)
-
-                target = self.rounds[(self.rounds['MatchId'] == match_id)
-                                     & (self.rounds['MapName'] == map_name)
-                                     & (self.rounds['RoundNum'] == round_num)]
-                target = 1 if target['WinningSide'].iloc[0] == 'CT' else 0
-                self.targets.extend([target
-                                     for _ in range(transformed.shape[0])])
-
-            self.data = torch.stack(self.data)
-            self.targets = torch.Tensor(self.targets)
-
-            with open(os.path.join(folder,
-                                   self.split,
-                                   f'{transform_name}.pckl'), 'wb') as f:
-                pickle.dump((self.data, self.targets), f)
 
-        else:
+        cache = TransformCache(f'{folder}{self.split}/transformed')
+
+        # the distance tables and the outcomes CSVs the targets come from
+        map_fingerprint = ','.join(
+            f'{file_fingerprint(table_location(game_map))}:'
+            f'{file_fingerprint(rounds_location(folder, game_map))}'
+            for game_map in self.maps)
+
+        key = cache_key(self.transform,
+                        ','.join(self.maps),
+                        params={'ticks': self.tick_selection,
+                                'options': self.transform_options,
+                                # stored along with the tensors
+                                'columns': ['map_index', 'tick'],
+                                },
+                        dependencies=transform_dependencies(self.transform),
+                        map_fingerprint=map_fingerprint,
+                        )
+
+        shard_infos = [{'name': os.path.basename(shard_loc),
+                        'fingerprint': split_fingerprint(shard_loc),
+                        }
+                       for shard_loc in shards]
+
+        built = [{'name': shard['name'], 'fingerprint': shard['fingerprint']}
+                 for shard in cache.shards(key) or []]
+
+        if built != shard_infos[:len(built)]:
+            # a shard that was already transformed has changed, start over
+            built = []
+
+        if len(built) == len(shards):
             print('Reading transformed data...')
+        else:
+            self.rounds = load_outcomes([rounds_location(folder, game_map)
+                                         for game_map in self.maps])
 
-            with open(os.path.join(folder,
-                                   self.split,
-                                   f'{transform_name}.pckl'), 'rb') as f:
-                self.data, self.targets = pickle.load(f)
+        # only shards added since the last build are transformed
+        for shard_loc, shard_info in list(zip(shards,
+                                              shard_infos))[len(built):]:
+            raw_shard = RawSplit(shard_loc)
+
+            print(f'Transforming {shard_info["name"]}...')
+
+            data, targets, columns = self._transform_shard(raw_shard,
+                                                           num_workers,
+                                                           verbose)
+
+            shard_info['matches'] = sorted({key[:2]
+                                            for key in raw_shard.keys()})
+
+            if not built:
+                cache.save(key, data, targets, shard_info,
+                           info={'transform': transform_name,
+                                 'maps': self.maps,
+                                 'ticks': self.tick_selection,
+                                 'options': self.transform_options,
+                                 },
+                           columns=columns)
+            else:
+                cache.append(key, data, targets, shard_info, columns=columns)
+
+            built.append(shard_info)
+
+        # reopened from disk either way, so the built tensors aren't kept
+        # around in memory
+        self.data, self.targets = cache.load(key)
+        self.map_index = cache.load_column(key, 'map_index')
+        self.ticks = cache.load_column(key, 'tick')
+
+        self.compact = None
+
+        if compact:
+            self._load_compact(cache.location(key))
 
         print('\nDone!')
 
+    def _encode_blocks(self, encode, block_size):
+        # encode over the whole split, a block at a time so only one block
+        # of the memory-mapped data is read in at once. the blocks have to
+        # share the scale of their distances: the largest one fits them all,
+        # the (few) blocks quantized with another one are encoded again
+        n_samples = self.data.shape[0]
+        starts = range(0, max(n_samples, 1), block_size)
+
+        blocks = [encode(self.data[start:start + block_size].numpy())
+                  for start in starts]
+        scale = max(block['scale'] for block in blocks)
+
+        blocks = [block if block['scale'] == scale
+                  else encode(self.data[start:start + block_size].numpy(),
+                              scale)
+                  for start, block in zip(starts, blocks)]
+
+        parts = {name: np.concatenate([block[name] for block in blocks])
+                 for name in blocks[0] if name != 'scale'}
+        parts['scale'] = np.float64(scale)
+
+        return parts
+
+    def _load_compact(self, file_loc, block_size=65536):
+        # keeps the samples encoded in memory (uint16 distances, bit-packed
+        # alive flags, float16 nfl differences) and decodes them per batch
+        transform_name = self.transform.__name__
+
+        if transform_name not in COMPACT_CODECS:
+            raise ValueError(f'No compact storage for {transform_name}')
+
+        # the codecs expect the channels of area distances
+        if self.transform_options.get('distances', 'area') != 'area':
+            raise ValueError('No compact storage for '
+                             f'{self.transform_options["distances"]} '
+                             'distances')
+
+        encode, self._decode = COMPACT_CODECS[transform_name]
+
+        compact_loc = f'{file_loc}.compact.npz'
+        n_samples = self.data.shape[0]
+        parts = None
+
+        if os.path.exists(compact_loc):
+            parts = dict(np.load(compact_loc))
+
+        # missing, or older than samples appended since
+        if parts is None or parts['n_samples'] != n_samples:
+            print('Encoding compact data...')
+
+            parts = self._encode_blocks(encode, block_size)
+            parts['n_samples'] = np.int64(n_samples)
+            parts['max_abs_error'] = np.float64(0)
+
+            self.compact = parts
+
+            for start in range(0, n_samples, block_size):
+                stop = min(start + block_size, n_samples)
+                error = (self[start:stop][0] - self.data[start:stop]).abs()
+                parts['max_abs_error'] = np.float64(
+                    max(parts['max_abs_error'], error.max().item()))
+
+            np.savez(compact_loc, **parts)
+
+        self.compact = parts
+
+        compact_bytes = sum(values.nbytes for values in parts.values())
+        float_bytes = self.data.numel() * self.data.element_size()
+
+        self.storage_report = {'float32_bytes': float_bytes,
+                               'compact_bytes': compact_bytes,
+                               'max_abs_error': float(parts['max_abs_error']),
+                               }
+
+        print(f'Compact storage: {compact_bytes / 2 ** 20:.1f}MB instead of '
+              f'{float_bytes / 2 ** 20:.1f}MB, max decoding error '
+              f'{parts["max_abs_error"]:.4g}')
+
+        self.data = None
+
+    def _transform_shard(self, raw_shard, num_workers, verbose):
+        data = TensorBuffer()
+        targets = TensorBuffer()
+        map_index = TensorBuffer(dtype=torch.int16)
+        sample_ticks = TensorBuffer(dtype=torch.int32)
+
+        keys = raw_shard.keys()
+        game_maps = [key[1] for key in keys]
+
+        # fails before transforming anything if an outcome or a map is
+        # missing
+        round_outcomes = round_targets(self.rounds, keys)
+
+        unknown = sorted(set(game_maps) - set(self.maps))
+        if unknown:
+            raise ValueError(f'Rounds of {unknown} in {raw_shard.folder}, '
+                             f'which are not part of the maps {self.maps}')
+
+        # only reads the few columns needed to pick the ticks, every tick is
+        # kept without a selection
+        check_tick_columns(raw_shard, self.tick_selection)
+        tick_rounds = RawSplit(raw_shard.folder,
+                               tick_columns(**self.tick_selection))
+        ticks = [select_ticks(game_round, **self.tick_selection)
+                 for game_round in tick_rounds]
+
+        transformed_rounds = transform_rounds(raw_shard,
+                                              self.transform,
+                                              game_maps,
+                                              ticks=(ticks
+                                                     if self.tick_selection
+                                                     else None),
+                                              options=self.transform_options,
+                                              num_workers=num_workers,
+                                              verbose=verbose,
+                                              )
+
+        for target, game_map, round_ticks, transformed in zip(
+                round_outcomes, game_maps, ticks, transformed_rounds):
+            n_samples = transformed.shape[0]
+
+            data.extend(transformed)
+            targets.extend(torch.full((n_samples,), target))
+            map_index.extend(torch.full((n_samples,),
+                                        self.maps.index(game_map),
+                                        dtype=torch.int16))
+            # one sample per tick, in order
+            sample_ticks.extend(torch.from_numpy(round_ticks))
+
+        columns = {'map_index': map_index.tensor(),
+                   'tick': sample_ticks.tensor(),
+                   }
+
+        return data.tensor(), targets.tensor(), columns
+
     def __len__(self):
-        return self.data.shape[0]
+        return self.targets.shape[0]
 
     def __getitem__(self, idx):
-        return self.data[idx], self.targets[idx]
+        if self.compact is None:
+            return self.data[idx], self.targets[idx]
+
+        # idx can also be a whole batch of indices (e.g. from a BatchSampler
+        # with batch_size=None), which is then decoded in one go
+        if np.ndim(idx) == 0 and not isinstance(idx, slice):
+            data, targets = self[[int(idx)]]
+            return data[0], targets[0]
+
+        if not isinstance(idx, slice):
+            idx = np.asarray(idx)
+
+        parts = {name: values[idx] if values.ndim > 0 else values
+                 for name, values in self.compact.items()}
+
+        return self._decode(parts), self.targets[idx]
+
+
+class CSGOIterableDataset(torch.utils.data.IterableDataset):
+    # streams samples instead of holding a split in memory. rounds are read
+    # from the raw split store and transformed on the fly, or with
+    # pretransformed=True read in blocks from CSGODataset's tensor store.
+    # either way the work is divided between DataLoader workers, and samples
+    # go through a shuffle buffer when shuffle_buffer > 0. tick_selection
+    # keeps the same ticks as CSGODataset's
+
+    def __init__(self,
+                 folder='G:/datasets/csgo/',
+                 transform=None,
+                 dataset_split='train',
+                 shuffle_buffer=0,
+                 pretransformed=False,
+                 block_size=4096,
+                 verbose=False,
+                 rng_seed=13,
+                 transform_options=None,
+                 tick_selection=None):
+        super().__init__()
+
+        if transform is None:
+            raise ValueError('Transform required')
+
+        self.transform = transform
+        self.split = dataset_split
+        self.shuffle_buffer = shuffle_buffer
+        self.block_size = block_size
+        self.rng_seed = rng_seed
+        self.transform_options = transform_options or {}
+        self.tick_selection = tick_selection or {}
+        self.epoch = 0
+
+        if pretransformed:
+            self.dataset = CSGODataset(folder=folder,
+                                       transform=transform,
+                                       dataset_split=dataset_split,
+                                       verbose=verbose,
+                                       rng_seed=rng_seed,
+                                       transform_options=transform_options,
+                                       tick_selection=tick_selection,
+                                       )
+            self.n_units = -(-len(self.dataset) // block_size)
+        else:
+            self.dataset = None
+
+            shards = shard_folders(f'{folder}{self.split}')
+
+            if len(shards) == 0:
+                raise FileNotFoundError(f'No raw {self.split} split in '
+                                        f'{folder}, build it with '
+                                        'CSGODataset first')
+
+            self.raw_data = ShardedSplit(shards)
+            self.keys = self.raw_data.keys()
+
+            for shard in self.raw_data.shards:
+                check_tick_columns(shard, self.tick_selection)
+
+            self.targets = round_targets(
+                load_outcomes([rounds_location(folder, game_map)
+                               for game_map in dataset_maps(folder)]),
+                self.keys)
+            self.n_units = len(self.raw_data)
+
+    def set_epoch(self, epoch):
+        # changes the shuffling from one epoch to the next
+        self.epoch = epoch
+
+    def _units(self, worker_info):
+        # rounds (or blocks of samples) that this worker goes through
+        order = np.arange(self.n_units)
+
+        if self.shuffle_buffer > 0:
+            np.random.default_rng(self.rng_seed + self.epoch).shuffle(order)
+
+        if worker_info is not None:
+            order = order[worker_info.id::worker_info.num_workers]
+
+        return order
+
+    def _samples(self, worker_info):
+        for unit in self._units(worker_info):
+            if self.dataset is None:
+                game_round = self.raw_data[unit]
+
+                if self.tick_selection:
+                    ticks = select_ticks(game_round, **self.tick_selection)
+                    game_round = game_round[game_round['Tick'].isin(ticks)]
+
+                data = self.transform(game_round,
+                                      self.keys[unit][1],
+                                      **self.transform_options)
+                targets = torch.full((data.shape[0],),
+                                     float(self.targets[unit]))
+            else:
+                start = unit * self.block_size
+                data, targets = self.dataset[start:start + self.block_size]
+
+            yield from zip(data, targets)
+
+    def __iter__(self):
+        worker_info = torch.utils.data.get_worker_info()
+        samples = self._samples(worker_info)
+
+        if self.shuffle_buffer <= 0:
+            yield from samples
+            return
+
+        worker_id = 0 if worker_info is None else worker_info.id
+        rng = np.random.default_rng([self.rng_seed, self.epoch, worker_id])
+
+        buffer = []
+
+        for sample in samples:
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(sample)
+                continue
+
+            idx = rng.integers(len(buffer))
+            yield buffer[idx]
+            buffer[idx] = sample
+
+        for idx in rng.permutation(len(buffer)):
+            yield buffer[idx]
 
 
 if __name__ == '__main__':
@@ -0,0 +1,453 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
+
+
+# same 'data' folder that calc-distances.py writes into
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'data')
+
+# value stored for area pairs that were never computed/are unreachable
+UNREACHABLE = -1.0
+
+# tables kept open per process, least recently used ones are dropped beyond
+# this many so a build over the whole map pool stays bounded
+MAX_TABLES = 4
+
+_tables = OrderedDict()
+
+
+def table_location(game_map, folder=DATA_FOLDER):
+    return os.path.join(folder, f'distances_{game_map}.npy')
+
+
+def build_distance_table(csv_loc, game_map):
+    # dense (max_area + 1, max_area + 1) matrix, indexed directly by AreaId
+    distances = pd.read_csv(csv_loc)
+    distances = distances[distances['map'] == game_map]
+
+    if distances.shape[0] == 0:
+        raise ValueError(f'No distances found for {game_map} in {csv_loc}')
+
+    area_one = distances['areaId_1'].values.astype(np.int64)
+    area_two = distances['areaId_2'].values.astype(np.int64)
+    values = pd.to_numeric(distances['graph_distance'], errors='coerce')
+
+    size = max(area_one.max(), area_two.max()) + 1
+
+    table = np.full((size, size), UNREACHABLE, dtype=np.float32)
+    table[area_one, area_two] = values.fillna(UNREACHABLE).values
+
+    return table
+
+
+def nav_graph(game_map):
+    # networkx graph of the map's nav mesh, one node per AreaId. the csgo
+    # library is only needed to build the tables
+    from csgo.data import NAV_GRAPHS
+
+    return NAV_GRAPHS[game_map]
+
+
+# adjacency of the graph being processed, set once per worker process
+_graph = {}
+
+
+def _init_graph_worker(adjacency, directed, weighted):
+    _graph.update(adjacency=adjacency, directed=directed, weighted=weighted)
+
+
+def _source_distances(sources):
+    # one single-source search per area in sources -> their full rows
+    from scipy.sparse.csgraph import shortest_path
+
+    return shortest_path(_graph['adjacency'],
+                         method='D',
+                         directed=_graph['directed'],
+                         unweighted=not _graph['weighted'],
+                         indices=sources,
+                         )
+
+
+def graph_adjacency(graph, weight=None):
+    # the map's real AreaIds (sorted) and the sparse adjacency between them,
+    # rows/columns in the same order. without weight every edge counts 1
+    import networkx as nx
+
+    area_ids = np.array(sorted(graph.nodes), dtype=np.int64)
+    adjacency = nx.to_scipy_sparse_array(graph,
+                                         nodelist=area_ids.tolist(),
+                                         weight=weight,
+                                         format='csr',
+                                         )
+
+    return area_ids, adjacency
+
+
+def _timed_source_distances(sources):
+    start = time.perf_counter()
+    rows = _source_distances(sources)
+
+    return os.getpid(), time.perf_counter() - start, rows
+
+
+class BuildProgress:
+    # pairs done overall and per worker process, with throughput, ETA and
+    # how many batches are queued/in flight
+
+    def __init__(self, n_pairs, report_seconds=5, verbose=False):
+        self.n_pairs = n_pairs
+        self.report_seconds = report_seconds
+        self.verbose = verbose
+        self.done = 0
+        self.pending = 0
+        self.queued = 0
+        self.workers = {}
+        self.start_time = time.time()
+        self.last_report = self.start_time
+
+    def update(self, n_pairs, worker, seconds, pending=0, queued=0):
+        self.done += n_pairs
+        self.pending = pending
+        self.queued = queued
+
+        pairs, busy = self.workers.get(worker, (0, 0.0))
+        self.workers[worker] = (pairs + n_pairs, busy + seconds)
+
+        if self.verbose and (time.time() - self.last_report
+                             > self.report_seconds):
+            print(f'\r{self.report()}', end='')
+            self.last_report = time.time()
+
+    def summary(self):
+        elapsed = time.time() - self.start_time
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.n_pairs - self.done) / rate if rate > 0 else None
+
+        return {'pairs': self.done,
+                'total_pairs': self.n_pairs,
+                'seconds': elapsed,
+                'pairs_per_second': rate,
+                'eta_seconds': eta,
+                'pending_batches': self.pending,
+                'queued_batches': self.queued,
+                # while actually computing, not waiting on the queue
+                'worker_pairs_per_second': {
+                    worker: pairs / busy if busy > 0 else 0.0
+                    for worker, (pairs, busy) in self.workers.items()},
+                }
+
+    def report(self):
+        summary = self.summary()
+        eta = summary['eta_seconds']
+        per_worker = ', '.join(f'{rate:.0f}' for rate in
+                               summary['worker_pairs_per_second'].values())
+
+        return (f'{summary["pairs"]}/{summary["total_pairs"]} pairs, '
+                f'{summary["pairs_per_second"]:.0f}/s, '
+                f'ETA {"?" if eta is None else f"{eta:.0f}s"}, '
+                f'{summary["pending_batches"]} in flight, '
+                f'{summary["queued_batches"]} queued, '
+                f'per worker/s: {per_worker}')
+
+
+def _graph_rows(graph, weight, batches, num_workers, progress=None):
+    # yields (sources, distances) for every batch of source positions, as
+    # soon as it is done, computed by num_workers processes. at most two
+    # batches per worker are in flight, so results arrive steadily and the
+    # rest of the batches wait here rather than in the pool's queue
+    area_ids, adjacency = graph_adjacency(graph, weight)
+    init_args = (adjacency, graph.is_directed(), weight is not None)
+    n_areas = len(area_ids)
+
+    if num_workers < 2:
+        _init_graph_worker(*init_args)
+
+        for idx, sources in enumerate(batches):
+            worker, seconds, rows = _timed_source_distances(sources)
+
+            if progress is not None:
+                progress.update(len(sources) * n_areas, worker, seconds,
+                                queued=len(batches) - idx - 1)
+
+            yield sources, rows
+
+        return
+
+    executor = ProcessPoolExecutor(max_workers=num_workers,
+                                   initializer=_init_graph_worker,
+                                   initargs=init_args)
+
+    waiting = list(reversed(batches))
+    pending = {}
+
+    try:
+        while waiting or pending:
+            while waiting and len(pending) < 2 * num_workers:
+                sources = waiting.pop()
+                future = executor.submit(_timed_source_distances, sources)
+                pending[future] = sources
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                sources = pending.pop(future)
+                worker, seconds, rows = future.result()
+
+                if progress is not None:
+                    progress.update(len(sources) * n_areas, worker, seconds,
+                                    pending=len(pending),
+                                    queued=len(waiting))
+
+                yield sources, rows
+    finally:
+        # don't wait for the remaining batches if interrupted. cancelled
+        # here rather than with shutdown(cancel_futures=True), which needs
+        # python 3.9
+        for future in pending:
+            future.cancel()
+
+        executor.shutdown()
+
+
+def _batches(sources, sources_per_task):
+    return [sources[start:start + sources_per_task]
+            for start in range(0, len(sources), sources_per_task)]
+
+
+def area_table(distances, area_ids):
+    # (n_areas, n_areas) distances between the areas in area_ids -> dense
+    # table indexed directly by AreaId, UNREACHABLE for ids that aren't
+    # areas
+    size = area_ids.max() + 1
+    table = np.full((size, size), UNREACHABLE, dtype=np.float32)
+    table[np.ix_(area_ids, area_ids)] = distances
+
+    return table
+
+
+def graph_distance_table(graph, weight=None, num_workers=0,
+                         sources_per_task=32, verbose=False):
+    # all-pairs shortest paths over the nav graph as a dense table indexed
+    # by AreaId, like build_distance_table. distances are numbers of hops,
+    # the same as csgo's area_distance that distance_infos.csv was computed
+    # with (0 on the diagonal), or sums of the weight edge attribute. rows
+    # are computed in batches of sources, spread over num_workers processes
+    n_areas = graph.number_of_nodes()
+    distances = np.empty((n_areas, n_areas), dtype=np.float32)
+
+    batches = _batches(np.arange(n_areas), sources_per_task)
+    progress = BuildProgress(n_areas ** 2, verbose=verbose)
+
+    for sources, rows in _graph_rows(graph, weight, batches, num_workers,
+                                     progress):
+        rows[np.isinf(rows)] = UNREACHABLE
+        distances[sources] = rows
+
+    return area_table(distances, np.array(sorted(graph.nodes)))
+
+
+def partial_location(game_map, folder=DATA_FOLDER):
+    return os.path.join(folder, f'distances_{game_map}.partial')
+
+
+def metadata_location(game_map, folder=DATA_FOLDER):
+    return os.path.join(folder, f'distances_{game_map}.json')
+
+
+def _checkpoint(distances, done, work_folder):
+    # rows first, so the bitmap never marks rows that aren't on disk
+    distances.flush()
+
+    tmp_loc = os.path.join(work_folder, 'done.npy.tmp')
+
+    with open(tmp_loc, 'wb') as f:
+        np.save(f, np.packbits(done))
+
+    os.replace(tmp_loc, os.path.join(work_folder, 'done.npy'))
+
+
+def _open_partial(work_folder, info, restart):
+    # (distances memmap, done bitmap) of the build in work_folder, started
+    # over if it is for another graph/weight or restart is set
+    n_areas = len(info['area_ids'])
+    info_loc = os.path.join(work_folder, 'info.json')
+    matrix_loc = os.path.join(work_folder, 'distances.bin')
+    done_loc = os.path.join(work_folder, 'done.npy')
+
+    resume = not restart and os.path.exists(done_loc)
+
+    if resume:
+        with open(info_loc) as f:
+            resume = json.load(f) == info
+
+    if resume:
+        distances = np.memmap(matrix_loc, dtype=np.float32, mode='r+',
+                              shape=(n_areas, n_areas))
+        done = np.unpackbits(np.load(done_loc), count=n_areas).astype(bool)
+
+        return distances, done
+
+    shutil.rmtree(work_folder, ignore_errors=True)
+    os.makedirs(work_folder)
+
+    with open(info_loc, 'w') as f:
+        json.dump(info, f)
+
+    distances = np.memmap(matrix_loc, dtype=np.float32, mode='w+',
+                          shape=(n_areas, n_areas))
+    done = np.zeros(n_areas, dtype=bool)
+
+    _checkpoint(distances, done, work_folder)
+
+    return distances, done
+
+
+def build_map_table(game_map, graph=None, folder=DATA_FOLDER, weight=None,
+                    num_workers=0, sources_per_task=32,
+                    checkpoint_seconds=60, restart=False, verbose=False,
+                    report_seconds=5):
+    # graph_distance_table for a map, resumable: rows are written into a
+    # memory-mapped matrix in distances_{map}.partial, along with a bitmap
+    # of the rows done that is saved every checkpoint_seconds (and when
+    # interrupted). running it again only computes the missing rows, then
+    # the table and its metadata are saved and the partial folder removed.
+    # with verbose, progress is printed every report_seconds
+    if graph is None:
+        graph = nav_graph(game_map)
+
+    area_ids = np.array(sorted(graph.nodes), dtype=np.int64)
+    work_folder = partial_location(game_map, folder)
+
+    info = {'map': game_map,
+            'area_ids': area_ids.tolist(),
+            'weight': weight,
+            'directed': graph.is_directed(),
+            'n_edges': graph.number_of_edges(),
+            }
+
+    distances, done = _open_partial(work_folder, info, restart)
+
+    todo = np.flatnonzero(~done)
+    batches = _batches(todo, sources_per_task)
+    progress = BuildProgress(len(todo) * len(area_ids), report_seconds,
+                             verbose)
+    results = _graph_rows(graph, weight, batches, num_workers, progress)
+    last_checkpoint = time.time()
+
+    try:
+        for sources, rows in results:
+            rows[np.isinf(rows)] = UNREACHABLE
+            distances[sources] = rows
+            done[sources] = True
+
+            if time.time() - last_checkpoint > checkpoint_seconds:
+                _checkpoint(distances, done, work_folder)
+                last_checkpoint = time.time()
+    finally:
+        results.close()
+        _checkpoint(distances, done, work_folder)
+
+        if verbose:
+            print(f'\r{progress.report()}')
+
+    table = area_table(distances, area_ids)
+    save_distance_table(table, game_map, folder,
+                        metadata={'area_ids': info['area_ids'],
+                                  'weight': weight,
+                                  # of the last run, to size the pool
+                                  'build': dict(progress.summary(),
+                                                num_workers=num_workers,
+                                                sources_per_task=(
+                                                    sources_per_task)),
+                                  })
+
+    del distances
+    shutil.rmtree(work_folder)
+
+    return table
+
+
+def save_distance_table(table, game_map, folder=DATA_FOLDER, metadata=None):
+    # the table, then what it was built from in distances_{map}.json
+    os.makedirs(folder, exist_ok=True)
+
+    tmp_loc = f'{table_location(game_map, folder)}.tmp'
+
+    with open(tmp_loc, 'wb') as f:
+        np.save(f, table)
+
+    os.replace(tmp_loc, table_location(game_map, folder))
+
+    metadata = dict(metadata or {},
+                    map=game_map,
+                    shape=list(table.shape),
+                    dtype=str(table.dtype),
+                    unreachable=UNREACHABLE,
+                    )
+
+    with open(metadata_location(game_map, folder), 'w') as f:
+        json.dump(metadata, f)
+
+
+def get_distance_table(game_map, folder=DATA_FOLDER):
+    # loaded lazily (memory-mapped) the first time a map is needed, then
+    # kept until MAX_TABLES other maps have been used since
+    key = (game_map, folder)
+
+    if key in _tables:
+        _tables.move_to_end(key)
+    else:
+        file_loc = table_location(game_map, folder)
+
+        if not os.path.exists(file_loc):
+            raise FileNotFoundError(f'No distance table for {game_map} at '
+                                    f'{file_loc}, build it with '
+                                    'distance_table.py first')
+
+        _tables[key] = np.load(file_loc, mmap_mode='r')
+
+        while len(_tables) > MAX_TABLES:
+            _tables.popitem(last=False)
+
+    return _tables[key]
+
+
+def lookup_distances(table, area_ids):
+    # area_ids: (n_ticks, n_players) -> (n_ticks, n_players, n_players)
+    # in a single gather
+    area_ids = np.asarray(area_ids, dtype=np.int64)
+
+    return table[area_ids[:, :, None], area_ids[:, None, :]]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--distances',
+                        type=str,
+                        default=os.path.join(DATA_FOLDER,
+                                             'distance_infos.csv'),
+                        )
+
+    parser.add_argument('--maps',
+                        type=lambda s: s.split(','),
+                        default=['de_dust2'],
+                        )
+
+    args = parser.parse_args()
+
+    for game_map in args.maps:
+        print(f'Building distance table for {game_map}...')
+        table = build_distance_table(args.distances, game_map)
+        save_distance_table(table, game_map)
+        print(f'Saved {table.shape} table to {table_location(game_map)}')
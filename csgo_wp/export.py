@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import time
+import warnings
+import torch
+from csgo_wp.model import input_size
+
+
+# bumped whenever the artifact layout or the metadata fields change
+EXPORT_VERSION = 1
+
+METADATA_FILE = 'metadata.json'
+
+
+def sample_shape(transform, transform_options=None):
+    # (channels, ...) of one sample of a transform's output
+    return input_size(transform,
+                      (transform_options or {}).get('distances', 'area'))
+
+
+def _jit(fn, *args, **kwargs):
+    # torch.jit warns that it is deprecated on every call, it still is what
+    # loads without the python classes
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+
+        return fn(*args, **kwargs)
+
+
+def export_model(model, file_loc, transform, transform_options=None,
+                 model_type=None, model_options=None):
+    # saves model as TorchScript, traced on a batch of zeros, with what a
+    # consumer needs to feed it in the archive's metadata.json: the name of
+    # the transform (e.g. transform_multichannel) and its options, the shape
+    # of one sample and the versions it was exported with. model_type and
+    # model_options are only recorded, to know what the model was built
+    # from. the artifact loads without csgo_wp, see load_exported
+    transform_options = transform_options or {}
+    input_shape = sample_shape(transform, transform_options)
+
+    model = model.cpu().eval()
+
+    # batch norm and the squeezes in some models need more than 1 sample
+    example = torch.zeros((2,) + input_shape)
+
+    with torch.no_grad():
+        scripted = _jit(torch.jit.trace, model, example)
+
+    metadata = {'export_version': EXPORT_VERSION,
+                'torch_version': torch.__version__,
+                'created': time.time(),
+                'transform': transform,
+                'transform_options': transform_options,
+                'input_shape': list(input_shape),
+                'model_class': type(model).__name__,
+                'model_type': model_type,
+                'model_options': model_options or {},
+                'output': 'probability that CT wins the round',
+                }
+
+    tmp_loc = f'{file_loc}.tmp'
+    _jit(torch.jit.save, scripted, tmp_loc,
+         _extra_files={METADATA_FILE: json.dumps(metadata, default=str)})
+    os.replace(tmp_loc, file_loc)
+
+    return metadata
+
+
+def load_exported(file_loc, map_location='cpu'):
+    # (model in eval mode, metadata) from an export_model artifact
+    extra_files = {METADATA_FILE: ''}
+    model = _jit(torch.jit.load, file_loc,
+                 map_location=map_location,
+                 _extra_files=extra_files)
+    metadata = json.loads(extra_files[METADATA_FILE])
+
+    if metadata['export_version'] > EXPORT_VERSION:
+        raise ValueError(f'{file_loc} was exported with version '
+                         f'{metadata["export_version"]} of the format, only '
+                         f'up to {EXPORT_VERSION} is supported')
+
+    return model.eval(), metadata
+
+
+if __name__ == '__main__':
+    import argparse
+    from csgo_wp.model import (TRANSFORMS, add_model_arguments,
+                               check_model_arguments, load_model,
+                               model_kwargs, transform_kwargs)
+
+    parser = argparse.ArgumentParser()
+
+    # state dict saved by train.py
+    parser.add_argument('model',
+                        type=str,
+                        )
+
+    parser.add_argument('output',
+                        type=str,
+                        )
+
+    # same as in train.py, the model has to be rebuilt the same way
+    add_model_arguments(parser)
+
+    args = parser.parse_args()
+
+    check_model_arguments(parser, args)
+
+    model_options = model_kwargs(args)
+    model = load_model(args.model, args.model_type, **model_options)
+
+    metadata = export_model(model, args.output, TRANSFORMS[args.transform],
+                            transform_kwargs(args), args.model_type,
+                            model_options)
+
+    print(f'Exported {metadata["model_class"]} taking '
+          f'{tuple(metadata["input_shape"])} samples to {args.output}')
@@ -0,0 +1,271 @@
+#! /usr/bin/env python3
+
+import numpy as np
+import torch
+from csgo_wp.distance_table import (get_distance_table, lookup_distances,
+                                    UNREACHABLE)
+
+
+# players are ordered CT first, then T, each side sorted by SteamId
+CT = slice(0, 5)
+T = slice(5, 10)
+
+DIAG = np.arange(5)
+
+# uint16 code kept for UNREACHABLE distances
+UNREACHABLE_CODE = np.iinfo(np.uint16).max
+
+NFL_ATTRIBUTES = ['Hp',
+                  'Armor',
+                  'EqValue',
+                  'DistToBombsiteA',
+                  'DistToBombsiteB',
+                  ]
+
+# distance channels of the multichannel/nfl features: between the players'
+# nav areas (needs the map's distance table), straight-line between their
+# positions, or both
+DISTANCES = ['area', 'euclidean', 'both']
+
+POSITION_COLUMNS = ['X', 'Y', 'Z']
+
+
+def round_to_arrays(df, columns):
+    # one validated round (5 players per side, one row per player per tick)
+    # -> (n_ticks, 10, len(columns)) values and the (10,) SteamIds
+    df = df.drop_duplicates()
+    df = df.sort_values(['Tick', 'Side', 'PlayerSteamId'])
+
+    n_ticks = df['Tick'].nunique()
+
+    values = (df[columns].to_numpy(dtype=np.float64)
+                         .reshape(n_ticks, 10, len(columns)))
+    steam_ids = df['PlayerSteamId'].values[:10]
+
+    return values, steam_ids
+
+
+def euclidean_distances(positions):
+    # (n_ticks, n_players, 3) -> (n_ticks, n_players, n_players), all pairs
+    # at once by broadcasting
+    differences = positions[:, :, None, :] - positions[:, None, :, :]
+
+    return np.sqrt(np.einsum('tijk,tijk->tij', differences, differences))
+
+
+def _position_columns(distances):
+    if distances not in DISTANCES:
+        raise ValueError(f'Unknown distances {distances}, expected one of '
+                         f'{DISTANCES}')
+
+    return POSITION_COLUMNS if distances != 'area' else []
+
+
+def _distance_matrices(area_ids, positions, game_map, distances):
+    # the (n_ticks, 10, 10) distance matrices to use, in channel order.
+    # the distance table is only loaded when area distances are used
+    matrices = []
+
+    if distances in ['area', 'both']:
+        matrices.append(lookup_distances(get_distance_table(game_map),
+                                         area_ids.astype(np.int64)))
+
+    if distances in ['euclidean', 'both']:
+        matrices.append(euclidean_distances(positions))
+
+    return matrices
+
+
+def unsorted_columns():
+    return ['AreaId', 'IsAlive']
+
+
+def multichannel_columns(distances='area'):
+    return ['AreaId', 'IsAlive'] + _position_columns(distances)
+
+
+def nfl_columns(attributes=NFL_ATTRIBUTES, distances='area'):
+    return list(attributes) + ['AreaId'] + _position_columns(distances)
+
+
+def unsorted_features(values, steam_ids, game_map):
+    # values: AreaId, IsAlive -> (n_ticks, 1, 12, 10), players in SteamId
+    # order regardless of side
+    order = np.argsort(steam_ids, kind='stable')
+
+    area_ids = values[:, order, 0].astype(np.int64)
+    alive = values[:, order, 1]
+    is_ct = (np.arange(10) < 5)[order]
+
+    n_samples = area_ids.shape[0]
+
+    distances = lookup_distances(get_distance_table(game_map), area_ids)
+
+    additional_data = np.empty((n_samples, 10, 2), dtype=np.float32)
+    additional_data[:, :, 0] = alive
+    additional_data[:, :, 1] = is_ct
+
+    result = np.concatenate([distances.reshape(n_samples, 100),
+                             additional_data.reshape(n_samples, 20)],
+                            axis=1).astype(np.float32, copy=False)
+
+    return torch.from_numpy(result).view(n_samples, 1, 12, 10)
+
+
+def multichannel_features(values, steam_ids, game_map, distances='area'):
+    # values: multichannel_columns(distances) -> (n_ticks, 6, 5, 5), or
+    # (n_ticks, 10, 5, 5) with both distances, the euclidean ones right
+    # after the area ones. the alive channels are always the last 2
+    alive = values[:, :, 1]
+    matrices = _distance_matrices(values[:, :, 0], values[:, :, 2:5],
+                                  game_map, distances)
+
+    n_channels = 4 * len(matrices) + 2
+    result = np.zeros((values.shape[0], n_channels, 5, 5), dtype=np.float32)
+
+    # alive players on the diagonals
+    result[:, -2, DIAG, DIAG] = alive[:, T]
+    result[:, -1, DIAG, DIAG] = alive[:, CT]
+
+    for first, matrix in zip([0, 4], matrices):
+        # all 4 combinations
+        result[:, first] = matrix[:, T, T]
+        result[:, first + 1] = matrix[:, CT, CT]
+        result[:, first + 2] = matrix[:, T, CT]
+        result[:, first + 3] = matrix[:, CT, T]
+
+    return torch.from_numpy(result)
+
+
+def pairwise_differences(attributes):
+    # (n_ticks, 10, n_attributes) -> (n_ticks, n_attributes, 5, 5) where
+    # [:, a, i, j] is CT player i's attribute a minus T player j's
+    differences = attributes[:, CT, None, :] - attributes[:, None, T, :]
+
+    return differences.transpose(0, 3, 1, 2)
+
+
+def nfl_features(values, steam_ids, game_map, attributes=NFL_ATTRIBUTES,
+                 distances='area'):
+    # values: nfl_columns(attributes, distances)
+    # -> (n_ticks, n_attributes + 2, 5, 5), plus a last euclidean distance
+    # channel with both distances
+    n_attributes = len(attributes)
+
+    matrices = _distance_matrices(values[:, :, n_attributes],
+                                  values[:, :, n_attributes + 1:],
+                                  game_map, distances)
+    attributes = values[:, :, :n_attributes]
+
+    # T minus CT for the first attribute, already in the transposed (CT, T)
+    # layout. the original implementation used hp for this channel
+    ba_channel = attributes[:, None, T, 0] - attributes[:, CT, None, 0]
+
+    result = np.concatenate([pairwise_differences(attributes),
+                             matrices[0][:, None, CT, T],
+                             ba_channel[:, None],
+                             ]
+                            + [matrix[:, None, CT, T]
+                               for matrix in matrices[1:]],
+                            axis=1)
+
+    return torch.from_numpy(result.astype(np.float32))
+
+
+def quantize_distances(distances, scale=None):
+    # -> uint16 codes and the scale that decodes them. exact when distances
+    # are whole numbers below UNREACHABLE_CODE, which graph distances are.
+    # scale: one that is known to fit distances, e.g. when encoding a split
+    # in blocks that have to share it
+    unreachable = distances == UNREACHABLE
+    reachable = distances[~unreachable]
+
+    if reachable.size > 0 and reachable.min() < 0:
+        raise ValueError('Distances must be positive to be quantized')
+
+    top = reachable.max() if reachable.size > 0 else 0
+
+    if scale is None:
+        if top < UNREACHABLE_CODE and np.all(np.mod(reachable, 1) == 0):
+            scale = 1.0
+        else:
+            scale = float(top) / (UNREACHABLE_CODE - 1)
+
+    codes = np.round(distances / scale).astype(np.uint16)
+    codes[unreachable] = UNREACHABLE_CODE
+
+    return codes, np.float64(scale)
+
+
+def dequantize_distances(codes, scale):
+    distances = codes.astype(np.float32) * np.float32(scale)
+    distances[codes == UNREACHABLE_CODE] = UNREACHABLE
+
+    return distances
+
+
+# compact storage of transformed samples: each encode_* takes a float32
+# (n_samples, ...) array and returns the arrays to store, each decode_*
+# turns (a batch of) those back into the float32 tensor. scale is passed
+# on to quantize_distances
+
+def encode_unsorted(data, scale=None):
+    codes, scale = quantize_distances(data[:, 0, :10], scale)
+    flags = np.packbits(data[:, 0, 10:].reshape(-1, 20) > 0, axis=1)
+
+    return {'distances': codes, 'flags': flags, 'scale': scale}
+
+
+def decode_unsorted(parts):
+    n_samples = parts['distances'].shape[0]
+
+    result = np.empty((n_samples, 1, 12, 10), dtype=np.float32)
+    result[:, 0, :10] = dequantize_distances(parts['distances'],
+                                             parts['scale'])
+    result[:, 0, 10:] = np.unpackbits(parts['flags'],
+                                      axis=1,
+                                      count=20).reshape(n_samples, 2, 10)
+
+    return torch.from_numpy(result)
+
+
+def encode_multichannel(data, scale=None):
+    codes, scale = quantize_distances(data[:, :4], scale)
+    # only the diagonals of the alive channels are ever set
+    alive = np.packbits(data[:, 4:, DIAG, DIAG].reshape(-1, 10) > 0, axis=1)
+
+    return {'distances': codes, 'alive': alive, 'scale': scale}
+
+
+def decode_multichannel(parts):
+    n_samples = parts['distances'].shape[0]
+
+    result = np.zeros((n_samples, 6, 5, 5), dtype=np.float32)
+    result[:, :4] = dequantize_distances(parts['distances'], parts['scale'])
+    result[:, 4:, DIAG, DIAG] = np.unpackbits(parts['alive'],
+                                              axis=1,
+                                              count=10).reshape(n_samples,
+                                                                2, 5)
+
+    return torch.from_numpy(result)
+
+
+def encode_nfl(data, scale=None):
+    # the distance channel is second to last, after the attribute channels
+    codes, scale = quantize_distances(data[:, -2], scale)
+    differences = np.delete(data, -2, axis=1).astype(np.float16)
+
+    return {'distances': codes, 'differences': differences, 'scale': scale}
+
+
+def decode_nfl(parts):
+    differences = parts['differences'].astype(np.float32)
+    distances = dequantize_distances(parts['distances'], parts['scale'])
+
+    result = np.concatenate([differences[:, :-1],
+                             distances[:, None],
+                             differences[:, -1:],
+                             ],
+                            axis=1)
+
+    return torch.from_numpy(result)
@@ -0,0 +1,276 @@
+#! /usr/bin/env python3
+
+import hashlib
+import numpy as np
+import pandas as pd
+
+
+FRAMES_COLUMNS = ['MatchId',
+                  'MapName',
+                  'RoundNum',
+                  'Tick',
+                  'Second',
+                  'PlayerId',
+                  'PlayerSteamId',
+                  'TeamId',
+                  'Side',
+                  'X',
+                  'Y',
+                  'Z',
+                  'ViewX',
+                  'ViewY',
+                  'AreaId',
+                  'Hp',
+                  'Armor',
+                  'IsAlive',
+                  'IsFlashed',
+                  'IsAirborne',
+                  'IsDucking',
+                  'IsScoped',
+                  'IsWalking',
+                  'EqValue',
+                  'HasHelmet',
+                  'HasDefuse',
+                  'DistToBombsiteA',
+                  'DistToBombsiteB',
+                  'Created',
+                  'Updated']
+
+# only the columns the transforms need, in the smallest dtype that holds them
+# bombsite distances stay float64 so the nfl transform is unchanged
+FRAMES_DTYPES = {'MatchId': np.int32,
+                 'MapName': 'category',
+                 'RoundNum': np.int16,
+                 'Tick': np.int32,
+                 'Second': np.float32,
+                 'PlayerSteamId': np.int64,
+                 'X': np.float32,
+                 'Y': np.float32,
+                 'Z': np.float32,
+                 'AreaId': np.int32,
+                 'IsAlive': bool,
+                 'Side': pd.CategoricalDtype(['CT', 'T']),
+                 'Hp': np.int16,
+                 'Armor': np.int16,
+                 'EqValue': np.int32,
+                 'DistToBombsiteA': np.float64,
+                 'DistToBombsiteB': np.float64,
+                 }
+
+ROUND_KEY = ['MatchId', 'MapName', 'RoundNum']
+
+
+def map_file_name(game_map):
+    # 'de_dust2' -> 'dust2', as in the names of the exported files
+    return game_map.split('_', 1)[-1]
+
+
+def frames_location(folder, game_map):
+    return f'{folder}csgo_playerframes_{map_file_name(game_map)}.csv'
+
+
+def rounds_location(folder, game_map):
+    return f'{folder}csgo_rounds_{map_file_name(game_map)}.csv'
+
+
+def validate_rounds(frames):
+    # one pass over every round in frames. returns the round each row belongs
+    # to (numbered in order of appearance) and whether each round is usable:
+    # 5 players per side with exactly one row per player per tick
+    round_ids = (frames.groupby(ROUND_KEY, sort=False, observed=True)
+                       .ngroup()
+                       .values)
+    n_rounds = round_ids.max() + 1
+
+    rows = np.bincount(round_ids, minlength=n_rounds)
+    ticks = frames.groupby(round_ids)['Tick'].nunique().values
+
+    by_side = frames.groupby([round_ids, frames['Side']], observed=True)
+    side_players = by_side['PlayerSteamId'].nunique()
+    side_rounds = side_players.index.get_level_values(0)
+
+    players = np.bincount(side_rounds,
+                          weights=side_players.values,
+                          minlength=n_rounds)
+    bad_sides = np.bincount(side_rounds,
+                            weights=side_players.values != 5,
+                            minlength=n_rounds)
+
+    valid = (bad_sides == 0) & (rows == players * ticks)
+
+    return round_ids, valid
+
+
+def split_rounds(frames):
+    # yields (round, is valid) for every round in frames, sliced out through
+    # the group indices rather than one boolean scan per round
+    round_ids, valid = validate_rounds(frames)
+
+    order = np.argsort(round_ids, kind='stable')
+    ends = np.cumsum(np.bincount(round_ids))
+    starts = ends - np.bincount(round_ids)
+
+    for round_id, is_valid in enumerate(valid):
+        rows = order[starts[round_id]:ends[round_id]]
+
+        yield frames.iloc[rows], is_valid
+
+
+def read_frames(file_loc, chunk_size=1_000_000):
+    # yields the frames in chunks of chunk_size rows (None reads the whole
+    # file at once), from a headerless CSV export or a Parquet file with
+    # the same columns. pyarrow is only needed for Parquet
+    if str(file_loc).endswith('.parquet'):
+        import pyarrow.parquet
+
+        parquet_file = pyarrow.parquet.ParquetFile(file_loc)
+        batches = parquet_file.iter_batches(
+            batch_size=chunk_size or parquet_file.metadata.num_rows,
+            columns=list(FRAMES_DTYPES))
+
+        for batch in batches:
+            yield batch.to_pandas().astype(FRAMES_DTYPES)
+
+        return
+
+    reader = pd.read_csv(file_loc,
+                         names=FRAMES_COLUMNS,
+                         usecols=list(FRAMES_DTYPES),
+                         dtype=FRAMES_DTYPES,
+                         chunksize=chunk_size,
+                         )
+
+    if chunk_size is None:
+        reader = [reader]
+
+    yield from reader
+
+
+def stream_rounds(file_loc, chunk_size=1_000_000):
+    # yields (round, is valid) per complete (MatchId, MapName, RoundNum),
+    # reading chunk_size rows at a time, see read_frames. rows of a round
+    # have to be contiguous in the file, which is how the frames are
+    # exported
+    reader = read_frames(file_loc, chunk_size)
+
+    seen = set()
+    leftover = None
+
+    for chunk in reader:
+        if leftover is not None:
+            chunk = pd.concat([leftover, chunk])
+
+        # the last round might continue into the next chunk
+        is_last = np.logical_and.reduce([chunk[c].values == chunk[c].values[-1]
+                                         for c in ROUND_KEY])
+
+        leftover = chunk[is_last]
+        complete = chunk[~is_last]
+
+        if complete.shape[0] == 0:
+            continue
+
+        for game_round, is_valid in split_rounds(complete):
+            key = tuple(game_round[c].values[0] for c in ROUND_KEY)
+
+            if key in seen:
+                raise ValueError(f'Round {key} is not contiguous in '
+                                 f'{file_loc}')
+            seen.add(key)
+
+            yield game_round, is_valid
+
+    if leftover is not None and leftover.shape[0] > 0:
+        yield from split_rounds(leftover)
+
+
+def tick_columns(stride=None, seconds=None, on_change=False):
+    # what select_ticks needs from a round with these options. Second is
+    # only needed for seconds, splits saved before it was kept don't have it
+    columns = ['Tick']
+
+    if seconds is not None:
+        columns.append('Second')
+
+    if on_change:
+        columns += ['PlayerSteamId', 'AreaId', 'IsAlive']
+
+    return columns
+
+
+def select_ticks(game_round, stride=None, seconds=None, on_change=False):
+    # sorted ticks of a validated round to keep, consecutive ticks are
+    # nearly identical. at most one of: every stride-th tick, the first tick
+    # of every seconds long interval (from Second), or the ticks where any
+    # player's AreaId/IsAlive changed. the first tick is always kept
+    if sum([stride is not None, seconds is not None, bool(on_change)]) > 1:
+        raise ValueError('Only one of stride, seconds and on_change can be '
+                         'used to select ticks')
+
+    # players in the same order at every tick for on_change
+    frame = game_round.sort_values(['Tick', 'PlayerSteamId'] if on_change
+                                   else ['Tick'])
+    ticks, first_rows = np.unique(frame['Tick'].values, return_index=True)
+    n_ticks = ticks.shape[0]
+
+    if stride is not None:
+        keep = np.arange(n_ticks) % stride == 0
+    elif seconds is not None:
+        elapsed = frame['Second'].values[first_rows].astype(np.float64)
+        interval = np.floor((elapsed - elapsed[0]) / seconds)
+        keep = np.concatenate([[True], interval[1:] != interval[:-1]])
+    elif on_change:
+        state = (frame[['AreaId', 'IsAlive']].to_numpy(dtype=np.int64)
+                                             .reshape(n_ticks, -1))
+        changed = (state[1:] != state[:-1]).any(axis=1)
+        keep = np.concatenate([[True], changed])
+    else:
+        keep = np.ones(n_ticks, dtype=bool)
+
+    return ticks[keep]
+
+
+def load_outcomes(file_loc):
+    # WinningSide indexed (and sorted) by round, loaded once. file_loc can
+    # also be a list of files, e.g. one per map
+    if isinstance(file_loc, (list, tuple)):
+        outcomes = pd.concat([pd.read_csv(loc,
+                                          usecols=ROUND_KEY + ['WinningSide'])
+                              for loc in file_loc])
+    else:
+        outcomes = pd.read_csv(file_loc, usecols=ROUND_KEY + ['WinningSide'])
+
+    outcomes = outcomes.drop_duplicates(ROUND_KEY, keep='first')
+
+    return outcomes.set_index(ROUND_KEY)['WinningSide'].sort_index()
+
+
+def round_targets(outcomes, keys):
+    # 1 if CT won the round, 0 otherwise, for all rounds in one join
+    index = pd.MultiIndex.from_tuples(keys, names=ROUND_KEY)
+    winners = outcomes.reindex(index)
+
+    missing = winners.isna().values
+    if missing.any():
+        raise KeyError(f'No outcome found for {missing.sum()} rounds, '
+                       f'e.g. {index[missing][:5].tolist()}')
+
+    return (winners.values == 'CT').astype(np.int64)
+
+
+def split_for_value(value):
+    # value uniform in [0, 1): 60% train, 20% val, 20% test
+    if value > 0.8:
+        return 'test'
+    elif value < 0.6:
+        return 'train'
+    else:
+        return 'val'
+
+
+def match_split(match_id, map_name):
+    # for matches added after the initial build: a stand-in for the random
+    # draw that always puts the same match in the same split
+    digest = hashlib.sha256(f'{match_id}/{map_name}'.encode()).hexdigest()
+
+    return split_for_value(int(digest[:8], 16) / 16 ** 8)
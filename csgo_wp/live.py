@@ -0,0 +1,162 @@
+#! /usr/bin/env python3
+
+import numpy as np
+import torch
+from csgo_wp.distance_table import get_distance_table
+from csgo_wp.features import (CT, T, NFL_ATTRIBUTES,
+                              multichannel_features, nfl_features)
+
+
+class LiveRoundState:
+    # features of the current tick of a round being played, for in-match
+    # inference. the 10 players' AreaId, IsAlive and nfl attributes are kept
+    # in fixed arrays (CT first, then T, each side by SteamId, as in
+    # features.round_to_arrays), and an update only rewrites the rows and
+    # columns of the feature matrices that involve the player it changes.
+    # multichannel and nfl are always the same tensors, updated in place:
+    # the same values as transform_multichannel/transform_nfl for the tick
+
+    def __init__(self, game_map, ct_players, t_players,
+                 attributes=NFL_ATTRIBUTES):
+        if len(ct_players) != 5 or len(t_players) != 5:
+            raise ValueError('Need 5 players per side, got '
+                             f'{len(ct_players)} CT and {len(t_players)} T')
+
+        self.game_map = game_map
+        self.attributes = list(attributes)
+        self.table = np.asarray(get_distance_table(game_map))
+
+        self.steam_ids = np.concatenate([np.sort(ct_players),
+                                         np.sort(t_players)])
+        self.slots = {int(steam_id): slot
+                      for slot, steam_id in enumerate(self.steam_ids)}
+        self.attribute_index = {name: idx
+                                for idx, name in enumerate(self.attributes)}
+
+        self.area_ids = np.zeros(10, dtype=np.int64)
+        self.alive = np.zeros(10, dtype=np.float64)
+        self.values = np.zeros((10, len(self.attributes)), dtype=np.float64)
+
+        self._multichannel = np.zeros((1, 6, 5, 5), dtype=np.float32)
+        self._nfl = np.zeros((1, len(self.attributes) + 2, 5, 5),
+                             dtype=np.float32)
+
+        # share memory with the arrays above
+        self.multichannel = torch.from_numpy(self._multichannel)
+        self.nfl = torch.from_numpy(self._nfl)
+
+        self._recompute()
+
+    @classmethod
+    def from_frame(cls, frame, game_map, attributes=NFL_ATTRIBUTES):
+        # from the rows of a single tick, in the format of the frames files
+        sides = frame['Side'].values
+        state = cls(game_map,
+                    frame['PlayerSteamId'].values[sides == 'CT'],
+                    frame['PlayerSteamId'].values[sides == 'T'],
+                    attributes)
+
+        state.apply_frame(frame)
+
+        return state
+
+    def _recompute(self):
+        # everything from scratch, with the batch feature functions
+        values = np.concatenate([self.area_ids[:, None],
+                                 self.alive[:, None]],
+                                axis=1)[None]
+        self._multichannel[:] = multichannel_features(values,
+                                                      self.steam_ids,
+                                                      self.game_map)
+
+        values = np.concatenate([self.values,
+                                 self.area_ids[:, None]],
+                                axis=1)[None]
+        self._nfl[:] = nfl_features(values,
+                                    self.steam_ids,
+                                    self.game_map,
+                                    self.attributes)
+
+    def _update_area(self, slot, area_id):
+        self.area_ids[slot] = area_id
+
+        table = self.table
+        areas = self.area_ids
+        multichannel = self._multichannel[0]
+        distances = self._nfl[0, -2]
+
+        if slot < 5:
+            i = slot
+            multichannel[1, i, :] = table[area_id, areas[CT]]
+            multichannel[1, :, i] = table[areas[CT], area_id]
+            multichannel[3, i, :] = table[area_id, areas[T]]
+            multichannel[2, :, i] = table[areas[T], area_id]
+            distances[i, :] = multichannel[3, i, :]
+        else:
+            j = slot - 5
+            multichannel[0, j, :] = table[area_id, areas[T]]
+            multichannel[0, :, j] = table[areas[T], area_id]
+            multichannel[2, j, :] = table[area_id, areas[CT]]
+            multichannel[3, :, j] = table[areas[CT], area_id]
+            distances[:, j] = multichannel[3, :, j]
+
+    def _update_alive(self, slot, is_alive):
+        self.alive[slot] = is_alive
+
+        if slot < 5:
+            self._multichannel[0, 5, slot, slot] = is_alive
+        else:
+            self._multichannel[0, 4, slot - 5, slot - 5] = is_alive
+
+    def _update_attribute(self, slot, idx, value):
+        self.values[slot, idx] = value
+
+        nfl = self._nfl[0]
+        attribute = self.values[:, idx]
+
+        # same float64 differences as nfl_features, then float32
+        if slot < 5:
+            nfl[idx, slot, :] = value - attribute[T]
+
+            if idx == 0:
+                nfl[-1, slot, :] = attribute[T] - value
+        else:
+            j = slot - 5
+            nfl[idx, :, j] = attribute[CT] - value
+
+            if idx == 0:
+                nfl[-1, :, j] = value - attribute[CT]
+
+    def update(self, steam_id, changes):
+        # changes: new values of some of a player's columns, e.g.
+        # {'AreaId': 1204, 'Hp': 73}. columns that aren't features are
+        # ignored
+        slot = self.slots[int(steam_id)]
+
+        for name, value in changes.items():
+            if name == 'AreaId':
+                if value != self.area_ids[slot]:
+                    self._update_area(slot, int(value))
+            elif name == 'IsAlive':
+                if value != self.alive[slot]:
+                    self._update_alive(slot, float(value))
+
+            if name in self.attribute_index:
+                idx = self.attribute_index[name]
+
+                if value != self.values[slot, idx]:
+                    self._update_attribute(slot, idx, float(value))
+
+    def apply(self, updates):
+        # {steam_id: changes} for the players that changed this tick
+        for steam_id, changes in updates.items():
+            self.update(steam_id, changes)
+
+    def apply_frame(self, frame):
+        # rows of a tick, all of them or only those of players that changed
+        columns = [name for name in ['AreaId', 'IsAlive'] + self.attributes
+                   if name in frame.columns]
+
+        for steam_id, row in zip(frame['PlayerSteamId'].values,
+                                 frame[columns].to_dict('records')):
+            self.update(steam_id, row)
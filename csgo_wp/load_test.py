@@ -0,0 +1,126 @@
+#! /usr/bin/env python3
+
+import asyncio
+import json
+import time
+import numpy as np
+from csgo_wp.server import read_message, write_message
+
+
+async def open_client(host='127.0.0.1', port=8000, unix_socket=None):
+    if unix_socket is not None:
+        return await asyncio.open_unix_connection(unix_socket)
+
+    return await asyncio.open_connection(host, port)
+
+
+async def request(reader, writer, method, path, payload=None):
+    # -> (status, decoded JSON response), over a kept-alive connection
+    body = b'' if payload is None else json.dumps(payload).encode()
+    write_message(writer, f'{method} {path} HTTP/1.1', body)
+    await writer.drain()
+
+    start_line, response = await read_message(reader)
+
+    return int(start_line.split()[1]), json.loads(response)
+
+
+async def match_feed(connection, duration, interval, rng, latencies):
+    # one match: a tick's features every interval seconds, random ones
+    reader, writer = await open_client(**connection)
+    end_time = time.perf_counter() + duration
+
+    try:
+        while time.perf_counter() < end_time:
+            features = rng.integers(0, 50, size=(6, 5, 5)).astype(float)
+            features[4:] = np.diag(rng.random(5) > 0.3)[None]
+
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, 'POST', '/predict',
+                                      {'features': features.tolist()})
+            latencies.append(time.perf_counter() - start)
+
+            if status != 200:
+                raise RuntimeError(f'Request failed with status {status}')
+
+            if interval > 0:
+                await asyncio.sleep(interval)
+    finally:
+        writer.close()
+
+
+async def run_load(n_feeds=64, duration=10.0, interval=0.0, seed=13,
+                   **connection):
+    # n_feeds concurrent match feeds for duration seconds -> client side
+    # latency/throughput, and the server's own stats
+    latencies = []
+    start = time.perf_counter()
+
+    await asyncio.gather(*[match_feed(connection, duration, interval,
+                                      np.random.default_rng([seed, feed]),
+                                      latencies)
+                           for feed in range(n_feeds)])
+
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await open_client(**connection)
+    _, server_stats = await request(reader, writer, 'GET', '/stats')
+    writer.close()
+
+    latencies = np.array(latencies) * 1000
+
+    return {'requests': len(latencies),
+            'throughput': len(latencies) / elapsed,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'server': server_stats,
+            }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--host',
+                        type=str,
+                        default='127.0.0.1',
+                        )
+
+    parser.add_argument('--port',
+                        type=int,
+                        default=8000,
+                        )
+
+    parser.add_argument('--unix-socket',
+                        type=str,
+                        default=None,
+                        )
+
+    parser.add_argument('--feeds',
+                        type=int,
+                        default=64,
+                        )
+
+    parser.add_argument('--duration',
+                        type=float,
+                        default=10,
+                        )
+
+    # seconds between two ticks of a feed, 0 sends as fast as possible
+    parser.add_argument('--interval',
+                        type=float,
+                        default=0,
+                        )
+
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args.feeds,
+                                   args.duration,
+                                   args.interval,
+                                   host=args.host,
+                                   port=args.port,
+                                   unix_socket=args.unix_socket,
+                                   ))
+
+    print(json.dumps(results, indent=2))
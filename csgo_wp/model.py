@@ -111,8 +111,9 @@ class ResNet(torch.nn.Module):
         self.bn_activated = batch_norm
         self.dropout_activated = dropout
 
-        hidden_sizes.insert(0, self.input_size)
-        hidden_sizes.append(self.output_size)
+        # not in place, the default list is shared between instances
+        hidden_sizes = ([self.input_size] + list(hidden_sizes)
+                        + [self.output_size])
 
         self.blocks = torch.nn.ModuleList()
 
@@ -262,8 +263,9 @@ class FCNN(torch.nn.Module):
         self.bn_activated = batch_norm
         self.dropout_activated = dropout
 
-        hidden_sizes.insert(0, self.input_size)
-        hidden_sizes.append(self.output_size)
+        # not in place, the default list is shared between instances
+        hidden_sizes = ([self.input_size] + list(hidden_sizes)
+                        + [self.output_size])
 
         self.linear_blocks = torch.nn.ModuleList()
 
@@ -321,8 +323,9 @@ class LR_CNN(torch.nn.Module):
         self.output_size = output_size
         self.ablation = ablation
 
-        hidden_sizes.insert(0, self.linear_input_size)
-        hidden_sizes.append(self.output_size)
+        # not in place, the default list is shared between instances
+        hidden_sizes = ([self.linear_input_size] + list(hidden_sizes)
+                        + [self.output_size])
 
         self.linear_blocks = torch.nn.ModuleList()
         self.conv_blocks = torch.nn.ModuleList()
@@ -348,6 +351,12 @@ class LR_CNN(torch.nn.Module):
         block_output_size = self.cnn_input_size[1:]
         n_channels = 1
 
+        # every channel but the last 2 (alive players) is a distance channel
+        # for the conv blocks, e.g. 8 with both area and euclidean distances
+        cnn_options = (((self.cnn_input_size[0] - 2,)
+                        + tuple(cnn_options[0][1:]),)
+                       + tuple(cnn_options[1:]))
+
         for option_set in cnn_options:
             block = ConvBlock(*option_set,
                               activation,
@@ -403,8 +412,8 @@ class LR_CNN(torch.nn.Module):
     def forward(self, x):
 
         # divide input into cnn/fc sections
-        cnn_x = x[:, :4, :, :]
-        fc_x = x[:, 4:, :, :]
+        cnn_x = x[:, :-2, :, :]
+        fc_x = x[:, -2:, :, :]
 
         # shape: (batch_size, 2, 5)
         fc_x = fc_x.diagonal(0, dim1=2, dim2=3)
@@ -539,6 +548,171 @@ class NFL_NN(torch.nn.Module):
         return x[:, 1]
 
 
+# as passed to train.py's --model-type
+MODELS = {'fc': FCNN,
+          'cnn': CNN,
+          'res': ResNet,
+          'lrcnn': LR_CNN,
+          'nfl': NFL_NN,
+          }
+
+
+def load_model(state_dict_loc, model_type='lrcnn', **model_options):
+    # a state dict saved by train.py, in a model built with the same
+    # constructor arguments it was trained with, in eval mode
+    model = MODELS[model_type](**model_options)
+    model.load_state_dict(torch.load(state_dict_loc, map_location='cpu'))
+
+    return model.eval()
+
+
+def predict(model, features, batch_size=4096):
+    # model's outputs for features, batch_size samples at a time, flattened
+    with torch.no_grad():
+        return torch.cat([model(features[i:i + batch_size]).reshape(-1)
+                          for i in range(0, features.shape[0], batch_size)])
+
+
+# data_transform functions, as passed to --transform
+TRANSFORMS = {'unsorted': 'transform_data',
+              'channels': 'transform_multichannel',
+              'nfl': 'transform_nfl',
+              }
+
+# shape of one sample of each transform, with area distances
+INPUT_SIZES = {'transform_data': (1, 12, 10),
+               'transform_multichannel': (6, 5, 5),
+               'transform_nfl': (7, 5, 5),
+               }
+
+# channels the transforms add with both area and euclidean distances, see
+# features.py
+BOTH_DISTANCES_CHANNELS = {'transform_multichannel': 4,
+                           'transform_nfl': 1,
+                           }
+
+
+def input_size(transform, distances='area'):
+    # of one sample of a data_transform transform, e.g.
+    # input_size('transform_multichannel', 'both') == (10, 5, 5)
+    channels, *rest = INPUT_SIZES[transform]
+
+    if distances == 'both':
+        channels += BOTH_DISTANCES_CHANNELS[transform]
+
+    return (channels, *rest)
+
+
+def add_model_arguments(parser):
+    # options to build a model with and the transform it takes, the same in
+    # train.py and in everything that rebuilds a model it saved
+    parser.add_argument('--model-type',
+                        type=str,
+                        default='fc',
+                        )
+
+    parser.add_argument('--hidden-sizes',
+                        type=lambda s: [int(item) for item in s.split(',')],
+                        default=[200, 100, 50],
+                        )
+
+    parser.add_argument('--cnn-options',
+                        type=lambda x: tuple(tuple(int(item)
+                                                   for item in s.split(','))
+                                             for s in x.split('|')),
+                        default=((1, 1, 3, 1, 0, 2, 1, 0),),
+                        )
+
+    parser.add_argument('--dropout',
+                        type=bool,
+                        default=False,
+                        )
+
+    parser.add_argument('--batch-norm',
+                        type=bool,
+                        default=False,
+                        )
+
+    parser.add_argument('--activation',
+                        type=str,
+                        default='ReLU',
+                        )
+
+    parser.add_argument('--activation-params',
+                        type=dict,
+                        default={},
+                        )
+
+    parser.add_argument('--transform',
+                        type=str,
+                        default='unsorted',
+                        )
+
+    # area, euclidean or both, for the channels and nfl transforms
+    parser.add_argument('--distances',
+                        type=str,
+                        default='area',
+                        )
+
+
+def check_model_arguments(parser, args):
+    # exits through parser.error on options no model can be built with
+    if args.model_type not in MODELS:
+        parser.error('Model type not supported, only one of '
+                     f'{", ".join(MODELS)} allowed')
+
+    if not all([len(x) == 8 for x in args.cnn_options]):
+        parser.error('Invalid CNN options passed in: was missing argument')
+
+    if args.activation not in torch.nn.__dict__.keys():
+        parser.error('Invalid activation passed in: does not exist')
+
+    if args.transform not in TRANSFORMS:
+        parser.error(f'Invalid transform passed in: must be one of '
+                     f'{", ".join(TRANSFORMS)}')
+
+    if args.distances not in ['area', 'euclidean', 'both']:
+        parser.error('Invalid distances passed in: must be one of area, '
+                     'euclidean, both')
+
+    if args.distances != 'area' and args.transform == 'unsorted':
+        parser.error('Only area distances available for the unsorted '
+                     'transform')
+
+    channels = input_size(TRANSFORMS[args.transform], args.distances)[0]
+
+    if args.model_type == 'nfl' and channels != 7:
+        parser.error('The nfl model takes the 7 channels of the nfl '
+                     'transform with a single distance channel')
+
+    # lrcnn sizes its first conv block from the input
+    if args.model_type == 'cnn' and args.cnn_options[0][0] != channels:
+        parser.error(f'The first CNN block takes {args.cnn_options[0][0]} '
+                     f'channels, the {args.transform} transform gives '
+                     f'{channels}')
+
+
+def transform_kwargs(args):
+    # keyword arguments of the transform
+    if args.distances != 'area':
+        return {'distances': args.distances}
+
+    return {}
+
+
+def model_kwargs(args):
+    # keyword arguments of the MODELS constructor
+    return {'input_size': input_size(TRANSFORMS[args.transform],
+                                     args.distances),
+            'hidden_sizes': args.hidden_sizes,
+            'activation': args.activation,
+            'activation_params': args.activation_params,
+            'dropout': args.dropout,
+            'batch_norm': args.batch_norm,
+            'cnn_options': args.cnn_options,
+            }
+
+
 if __name__ == '__main__':
 
     # dummy data for testing
@@ -0,0 +1,351 @@
+#! /usr/bin/env python3
+
+import copy
+import time
+import warnings
+import numpy as np
+import torch
+from csgo_wp.model import (ConvBlock, LinearBlock, CNN, FCNN, LR_CNN, NFL_NN,
+                           ResNet, predict)
+
+
+DROPOUTS = (torch.nn.Dropout, torch.nn.Dropout1d, torch.nn.Dropout2d,
+            torch.nn.Dropout3d, torch.nn.AlphaDropout)
+
+
+def _is_noop(layer):
+    # in eval mode
+    if isinstance(layer, DROPOUTS + (torch.nn.Identity,)):
+        return True
+
+    if isinstance(layer, torch.nn.MaxPool2d):
+        return (torch.nn.modules.utils._pair(layer.kernel_size) == (1, 1)
+                and torch.nn.modules.utils._pair(layer.stride) == (1, 1)
+                and torch.nn.modules.utils._pair(layer.padding) == (0, 0))
+
+    return False
+
+
+def _layers(blocks):
+    # the layers of blocks applied one after the other, with the LinearBlock
+    # and ConvBlock wrappers taken apart and without the ones that do
+    # nothing at inference time
+    for block in blocks:
+        if isinstance(block, LinearBlock):
+            layers = [block.fc, block.activation]
+        elif isinstance(block, ConvBlock):
+            layers = [block.conv, block.maxpool, block.activation]
+        else:
+            layers = [block]
+
+        yield from (layer for layer in layers if not _is_noop(layer))
+
+
+def _batch_norm_affine(norm):
+    # eval mode batch norm as x * scale + shift, per channel
+    scale = torch.rsqrt(norm.running_var + norm.eps)
+
+    if norm.affine:
+        scale = scale * norm.weight
+
+    shift = -norm.running_mean * scale
+
+    if norm.affine:
+        shift = shift + norm.bias
+
+    return scale.detach(), shift.detach()
+
+
+def _fold_following(norm, layer, repeat=1):
+    # layer(norm(x)) as a single layer, for a Linear or a Conv without
+    # padding (padding would see zeros instead of the shifted values). with
+    # repeat, x is flattened between norm and layer, so every channel covers
+    # repeat consecutive inputs of layer
+    scale, shift = _batch_norm_affine(norm)
+    scale = scale.repeat_interleave(repeat)
+    shift = shift.repeat_interleave(repeat)
+
+    layer = copy.deepcopy(layer)
+    weight = layer.weight.detach()
+    shape = (1, -1) + (1,) * (weight.dim() - 2)
+
+    # a conv adds up the shift over its whole kernel
+    kernel_sums = weight.flatten(start_dim=2).sum(dim=2) \
+        if weight.dim() > 2 else weight
+    bias = kernel_sums @ shift
+
+    if layer.bias is not None:
+        bias = bias + layer.bias.detach()
+    else:
+        layer.bias = torch.nn.Parameter(torch.zeros(weight.shape[0]))
+
+    layer.weight.data = weight * scale.view(shape)
+    layer.bias.data = bias
+
+    return layer
+
+
+def _can_fold_following(norm, layer):
+    if isinstance(layer, torch.nn.Linear):
+        return layer.in_features == norm.num_features
+
+    if isinstance(layer, (torch.nn.Conv1d, torch.nn.Conv2d)):
+        return (layer.groups == 1
+                and layer.in_channels == norm.num_features
+                and not any(layer.padding))
+
+    return False
+
+
+def fold_batch_norms(layers):
+    # layers applied one after the other (see _layers), with every batch norm
+    # folded into the Linear or Conv right before it or, as in these models
+    # where it comes after the activation, into the one right after it
+    # (through a Flatten as well). the ones that can't be folded are kept
+    layers = list(layers)
+    folded = []
+
+    for idx, layer in enumerate(layers):
+        if not isinstance(layer, torch.nn.modules.batchnorm._BatchNorm):
+            folded.append(layer)
+            continue
+
+        previous = folded[-1] if folded else None
+        following = layers[idx + 1:idx + 3]
+
+        if (isinstance(previous, torch.nn.Linear)
+                and isinstance(layer, torch.nn.BatchNorm1d)):
+            folded[-1] = torch.nn.utils.fusion.fuse_linear_bn_eval(previous,
+                                                                   layer)
+        elif ((isinstance(previous, torch.nn.Conv1d)
+               and isinstance(layer, torch.nn.BatchNorm1d))
+              or (isinstance(previous, torch.nn.Conv2d)
+                  and isinstance(layer, torch.nn.BatchNorm2d))):
+            folded[-1] = torch.nn.utils.fusion.fuse_conv_bn_eval(previous,
+                                                                 layer)
+        elif following and _can_fold_following(layer, following[0]):
+            layers[idx + 1] = _fold_following(layer, following[0])
+        elif (len(following) == 2
+                and isinstance(following[0], torch.nn.Flatten)
+                and isinstance(following[1], torch.nn.Linear)
+                and following[1].in_features % layer.num_features == 0):
+            repeat = following[1].in_features // layer.num_features
+            layers[idx + 2] = _fold_following(layer, following[1], repeat)
+        else:
+            folded.append(layer)
+
+    return folded
+
+
+def _sequential(layers):
+    layers = list(layers)
+
+    if len(layers) == 1:
+        return layers[0]
+
+    return torch.nn.Sequential(*layers)
+
+
+def _fold_nfl(model):
+    # forward uses the layers by name, folded batch norms become Identity
+    for norm, conv in [('norm1', 'conv4'),
+                       ('norm2', 'conv5'),
+                       ('norm3', 'conv6'),
+                       ('norm5', 'fc2'),
+                       ]:
+        setattr(model, conv, _fold_following(getattr(model, norm),
+                                             getattr(model, conv)))
+        setattr(model, norm, torch.nn.Identity())
+
+    # norm4 is followed by the max pooling and norm6 is a LayerNorm
+    model.dropout = torch.nn.Identity()
+
+
+def quantize_linear(model):
+    # int8 weights for the Linear layers, activations quantized on the fly
+    with warnings.catch_warnings():
+        # torch.ao.quantization is deprecated in favor of torchao, which
+        # isn't a dependency
+        warnings.simplefilter('ignore', DeprecationWarning)
+        warnings.simplefilter('ignore', UserWarning)
+
+        return torch.ao.quantization.quantize_dynamic(model,
+                                                      {torch.nn.Linear},
+                                                      dtype=torch.qint8)
+
+
+def optimize_model(model, quantize=True):
+    # a copy of model for CPU inference: batch norms folded into the layers
+    # around them, dropout and no-op layers removed and, with quantize, int8
+    # Linear layers. same outputs as model in eval mode, up to rounding (and
+    # the quantization error)
+    model = copy.deepcopy(model).cpu().eval()
+
+    if isinstance(model, (FCNN, LR_CNN)):
+        model.linear_blocks = torch.nn.ModuleList(
+            fold_batch_norms(_layers(model.linear_blocks)))
+    elif isinstance(model, ResNet):
+        model.blocks = torch.nn.ModuleList(
+            fold_batch_norms(_layers(model.blocks)))
+    elif isinstance(model, NFL_NN):
+        _fold_nfl(model)
+
+    if isinstance(model, (CNN, LR_CNN)):
+        # forward reshapes the output of the conv blocks before the linear
+        # block, the batch norms of the last conv block fold into it
+        if isinstance(model, LR_CNN):
+            linear = model.cnn_linear
+        else:
+            linear = model.linear
+
+        layers = fold_batch_norms(list(_layers(model.conv_blocks))
+                                  + [torch.nn.Flatten()]
+                                  + list(_layers([linear])))
+
+        split = next(idx for idx, layer in enumerate(layers)
+                     if isinstance(layer, torch.nn.Flatten))
+        model.conv_blocks = torch.nn.ModuleList(layers[:split])
+
+        # the last batch norm of the conv blocks, not used by forward
+        del model.norm_conv
+        linear = _sequential(layers[split + 1:])
+
+        if isinstance(model, LR_CNN):
+            model.cnn_linear = linear
+            model.final_linear = _sequential(_layers([model.final_linear]))
+        else:
+            model.linear = linear
+
+    if quantize:
+        model = quantize_linear(model)
+
+    return model
+
+
+def throughput(model, features, batch_size=4096, repeats=5):
+    # samples per second, best of repeats passes over features
+    predict(model, features[:batch_size], batch_size)
+    times = []
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        predict(model, features, batch_size)
+        times.append(time.perf_counter() - start_time)
+
+    return features.shape[0] / min(times)
+
+
+def compare_models(model, optimized, features, targets, batch_size=4096,
+                   repeats=5):
+    # AUC, log loss and throughput of both models on the same samples
+    from sklearn.metrics import log_loss, roc_auc_score
+
+    y_true = targets.numpy().astype(float).reshape(-1)
+    results = {}
+
+    for name, candidate in [('float', model.eval()), ('optimized', optimized)]:
+        y_pred = predict(candidate, features, batch_size).numpy()
+        y_pred = np.clip(y_pred.astype(float), 1e-7, 1 - 1e-7)
+
+        results[name] = {'auc': roc_auc_score(y_true, y_pred),
+                         'log_loss': log_loss(y_true, y_pred),
+                         'samples_per_second': throughput(candidate,
+                                                          features,
+                                                          batch_size,
+                                                          repeats),
+                         }
+
+    float_results, optimized_results = results['float'], results['optimized']
+
+    results['auc_delta'] = optimized_results['auc'] - float_results['auc']
+    results['log_loss_delta'] = (optimized_results['log_loss']
+                                 - float_results['log_loss'])
+    results['speedup'] = (optimized_results['samples_per_second']
+                          / float_results['samples_per_second'])
+
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    from csgo_wp import data_transform
+    from csgo_wp.data_transform import CSGODataset
+    from csgo_wp.export import export_model
+    from csgo_wp.model import (TRANSFORMS, add_model_arguments,
+                               check_model_arguments, load_model,
+                               model_kwargs, transform_kwargs)
+
+    parser = argparse.ArgumentParser()
+
+    # state dict saved by train.py
+    parser.add_argument('model',
+                        type=str,
+                        )
+
+    # same as in train.py, the model has to be rebuilt the same way
+    add_model_arguments(parser)
+
+    parser.add_argument('--maps',
+                        type=lambda s: s.split(','),
+                        default=None,
+                        )
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=4096,
+                        )
+
+    # keep the float Linear layers
+    parser.add_argument('--no-quantize',
+                        action='store_true',
+                        )
+
+    # export.py artifact of the optimized model
+    parser.add_argument('--export',
+                        type=str,
+                        default=None,
+                        )
+
+    args = parser.parse_args()
+
+    check_model_arguments(parser, args)
+
+    transform = getattr(data_transform, TRANSFORMS[args.transform])
+    transform_options = transform_kwargs(args)
+    model_options = model_kwargs(args)
+
+    model = load_model(args.model, args.model_type, **model_options)
+    optimized = optimize_model(model, quantize=not args.no_quantize)
+
+    test_dataset = CSGODataset(transform=transform,
+                               dataset_split='test',
+                               maps=args.maps,
+                               transform_options=transform_options,
+                               )
+    features, targets = test_dataset[:]
+
+    results = compare_models(model, optimized, features, targets,
+                             args.batch_size)
+
+    print(f'Test set, {features.shape[0]} samples, batches of '
+          f'{args.batch_size}, {torch.get_num_threads()} threads')
+
+    for name in ['float', 'optimized']:
+        print(f'{name:>9}: AUC {results[name]["auc"]:.4f}, '
+              f'log loss {results[name]["log_loss"]:.4f}, '
+              f'{results[name]["samples_per_second"]:,.0f} samples/s')
+
+    print(f'AUC delta {results["auc_delta"]:+.5f}, '
+          f'log loss delta {results["log_loss_delta"]:+.5f}, '
+          f'{results["speedup"]:.2f}x throughput')
+
+    if args.export is not None:
+        export_model(optimized, args.export,
+                     TRANSFORMS[args.transform],
+                     transform_options,
+                     model_type=args.model_type,
+                     model_options=dict(model_options,
+                                        optimized=True,
+                                        quantized=not args.no_quantize))
+
+        print(f'Exported the optimized model to {args.export}')
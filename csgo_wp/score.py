@@ -0,0 +1,224 @@
+#! /usr/bin/env python3
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import pandas as pd
+import torch
+from csgo_wp.data_transform import (ARRAY_TRANSFORMS, _init_worker,
+                                    _transform_frames, ordered_results)
+from csgo_wp.ingest import stream_rounds
+from csgo_wp.model import predict
+
+
+class PredictionWriter:
+    # appends batches of per-tick predictions to a CSV (with a header) or,
+    # for .parquet, a Parquet file with one row group per batch. pyarrow is
+    # only needed for Parquet
+
+    def __init__(self, file_loc):
+        self.file_loc = str(file_loc)
+        self.parquet = self.file_loc.endswith('.parquet')
+        self.n_rows = 0
+        self._writer = None
+
+    def write(self, predictions):
+        if self.parquet:
+            import pyarrow
+            import pyarrow.parquet
+
+            table = pyarrow.Table.from_pandas(predictions,
+                                              preserve_index=False)
+
+            if self._writer is None:
+                self._writer = pyarrow.parquet.ParquetWriter(self.file_loc,
+                                                             table.schema)
+
+            self._writer.write_table(table)
+        else:
+            predictions.to_csv(self.file_loc,
+                               mode='a' if self.n_rows else 'w',
+                               header=not self.n_rows,
+                               index=False)
+
+        self.n_rows += predictions.shape[0]
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _round_tasks(file_loc, rounds_per_task, chunk_size, counts, keys):
+    # (round, map) pairs for _transform_frames, rounds_per_task valid rounds
+    # at a time. the (MatchId, RoundNum, ticks) of the rounds of every task
+    # are added to keys
+    items = []
+    task_keys = []
+
+    for game_round, is_valid in stream_rounds(file_loc, chunk_size):
+        if not is_valid:
+            counts['invalid'] += 1
+            continue
+
+        items.append((game_round, game_round['MapName'].values[0]))
+        task_keys.append((game_round['MatchId'].values[0],
+                          game_round['RoundNum'].values[0],
+                          np.sort(game_round['Tick'].unique())))
+
+        if len(items) == rounds_per_task:
+            keys.append(task_keys)
+            yield items
+            items = []
+            task_keys = []
+
+    if items:
+        keys.append(task_keys)
+        yield items
+
+
+def score_frames(file_loc, out_loc, model, transform, options=None,
+                 num_workers=os.cpu_count(), rounds_per_task=64,
+                 batch_size=4096, chunk_size=1_000_000, game_maps=(),
+                 verbose=False):
+    # writes the model's probability that CT wins at every tick of every
+    # valid round of a frames file (CSV or Parquet, see ingest.read_frames)
+    # to out_loc. the file is read chunk_size rows at a time and rounds are
+    # transformed by num_workers processes, rounds_per_task per task, with
+    # at most 2 tasks per worker in flight, so memory stays bounded whatever
+    # the size of the file. game_maps are the distance tables to load in
+    # every worker up front, the others are loaded on first use. returns
+    # the numbers of scored rounds, ticks and skipped invalid rounds
+    options = options or {}
+    columns, features_fn = ARRAY_TRANSFORMS[transform.__name__]
+    task = partial(_transform_frames, partial(features_fn, **options),
+                   columns(**options))
+
+    model = model.eval()
+    writer = PredictionWriter(out_loc)
+    counts = {'rounds': 0, 'ticks': 0, 'invalid': 0}
+
+    def write(features):
+        keys = task_keys.popleft()
+        p_ct = predict(model, torch.cat(features), batch_size).numpy()
+
+        writer.write(pd.DataFrame({
+            'MatchId': np.concatenate([np.full(len(ticks), match_id)
+                                       for match_id, _, ticks in keys]),
+            'RoundNum': np.concatenate([np.full(len(ticks), round_num)
+                                        for _, round_num, ticks in keys]),
+            'Tick': np.concatenate([ticks for _, _, ticks in keys]),
+            'p_ct': p_ct,
+        }))
+
+        counts['rounds'] += len(keys)
+        counts['ticks'] += p_ct.shape[0]
+
+        if verbose:
+            print(f'\rScored {counts["rounds"]} rounds, '
+                  f'{counts["ticks"]} ticks', end='')
+
+    task_keys = deque()
+    tasks = _round_tasks(file_loc, rounds_per_task, chunk_size, counts,
+                         task_keys)
+
+    try:
+        if num_workers < 2:
+            for items in tasks:
+                write(task(items))
+        else:
+            with ProcessPoolExecutor(max_workers=num_workers,
+                                     initializer=_init_worker,
+                                     initargs=(tuple(game_maps),)
+                                     ) as executor:
+                # results are written in the order of the file
+                for features in ordered_results(executor, task, tasks,
+                                                2 * num_workers):
+                    write(features)
+    finally:
+        writer.close()
+
+    if verbose:
+        print()
+
+    return counts
+
+
+if __name__ == '__main__':
+    import argparse
+    from csgo_wp import data_transform
+    from csgo_wp.model import (TRANSFORMS, add_model_arguments,
+                               check_model_arguments, load_model,
+                               model_kwargs, transform_kwargs)
+
+    parser = argparse.ArgumentParser()
+
+    # playerframes, .csv (headerless export) or .parquet
+    parser.add_argument('frames',
+                        type=str,
+                        )
+
+    # .csv or .parquet
+    parser.add_argument('output',
+                        type=str,
+                        )
+
+    parser.add_argument('--model',
+                        type=str,
+                        required=True,
+                        )
+
+    # same as in train.py, the model has to be rebuilt the same way
+    add_model_arguments(parser)
+
+    parser.add_argument('--workers',
+                        type=int,
+                        default=os.cpu_count(),
+                        )
+
+    parser.add_argument('--rounds-per-task',
+                        type=int,
+                        default=64,
+                        )
+
+    parser.add_argument('--batch-size',
+                        type=int,
+                        default=4096,
+                        )
+
+    parser.add_argument('--chunk-size',
+                        type=int,
+                        default=1_000_000,
+                        )
+
+    # distance tables to load in every worker up front
+    parser.add_argument('--maps',
+                        type=lambda s: s.split(','),
+                        default=[],
+                        )
+
+    args = parser.parse_args()
+
+    check_model_arguments(parser, args)
+
+    model = load_model(args.model, args.model_type, **model_kwargs(args))
+
+    counts = score_frames(args.frames,
+                          args.output,
+                          model,
+                          getattr(data_transform, TRANSFORMS[args.transform]),
+                          transform_kwargs(args),
+                          num_workers=args.workers,
+                          rounds_per_task=args.rounds_per_task,
+                          batch_size=args.batch_size,
+                          chunk_size=args.chunk_size,
+                          game_maps=[f'de_{name}'
+                                     if not name.startswith('de_') else name
+                                     for name in args.maps],
+                          verbose=True,
+                          )
+
+    print(f'Wrote {counts["ticks"]} predictions for {counts["rounds"]} '
+          f'rounds to {args.output}, skipped {counts["invalid"]} rounds '
+          'with fewer than 10 players')
@@ -0,0 +1,388 @@
+#! /usr/bin/env python3
+
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import torch
+from csgo_wp.distance_table import get_distance_table
+from csgo_wp.export import load_exported
+from csgo_wp.features import round_to_arrays, multichannel_features
+from csgo_wp.model import load_model
+
+
+# a request is a single sample, anything larger is rejected before it is read
+MAX_BODY_SIZE = 1 << 20
+
+
+def players_to_features(players, game_map):
+    # raw state of the 10 players at a tick (dicts with PlayerSteamId, Side,
+    # AreaId and IsAlive, as in the frames files) -> (6, 5, 5) features
+    frame = pd.DataFrame(players)
+    frame['Tick'] = 0
+
+    if frame.shape[0] != 10 or (frame['Side'] == 'CT').sum() != 5:
+        raise ValueError('Need the state of 5 CT and 5 T players')
+
+    try:
+        table = get_distance_table(game_map)
+    except OSError:
+        raise ValueError(f'No distance table for map {game_map}')
+
+    area_ids = frame['AreaId'].to_numpy()
+
+    if not ((area_ids >= 0) & (area_ids < table.shape[0])).all():
+        raise ValueError(f'AreaIds must be between 0 and {table.shape[0] - 1}'
+                         f' on {game_map}')
+
+    values, steam_ids = round_to_arrays(frame, ['AreaId', 'IsAlive'])
+
+    return multichannel_features(values, steam_ids, game_map)[0]
+
+
+class LatencyStats:
+    # latencies of the last window requests, and how many were served
+
+    def __init__(self, window=10000):
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.n_requests = 0
+        self.start_time = time.perf_counter()
+
+    def add_batch(self, latencies):
+        self.latencies.extend(latencies)
+        self.batch_sizes.append(len(latencies))
+        self.n_requests += len(latencies)
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.start_time
+        latencies = np.array(self.latencies) * 1000
+
+        if latencies.size == 0:
+            latencies = np.zeros(1)
+
+        return {'requests': self.n_requests,
+                'throughput': self.n_requests / elapsed,
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'mean_batch_size': (float(np.mean(self.batch_sizes))
+                                    if self.batch_sizes else 0.0),
+                }
+
+
+class MicroBatcher:
+    # coalesces the samples of concurrent predict calls into batches of at
+    # most max_batch, waiting at most max_wait seconds after the first one
+    # for others to arrive. the model runs in its own thread so the event
+    # loop keeps accepting requests in the meantime
+
+    def __init__(self, model, max_batch=64, max_wait=0.002):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.stats = LatencyStats()
+
+        self._queue = None
+        self._worker = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._worker.cancel()
+
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+
+        self._executor.shutdown()
+
+    async def predict(self, features):
+        # features: (6, 5, 5) -> probability that CT wins
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((features, future, time.perf_counter()))
+
+        return await future
+
+    def _forward(self, batch):
+        with torch.no_grad():
+            return self.model(batch).tolist()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            items = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(items) < self.max_batch:
+                if not self._queue.empty():
+                    items.append(self._queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    items.append(await asyncio.wait_for(self._queue.get(),
+                                                        timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = torch.stack([features for features, _, _ in items])
+
+            try:
+                outputs = await loop.run_in_executor(self._executor,
+                                                     self._forward,
+                                                     batch)
+            except Exception as error:
+                for _, future, _ in items:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            done = time.perf_counter()
+
+            for (_, future, _), output in zip(items, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+            self.stats.add_batch([done - start for _, _, start in items])
+
+
+class PredictionServer:
+    # minimal HTTP/1.1 (keep-alive) over TCP or a Unix socket:
+    #   POST /predict {"features": 6x5x5 nested lists}
+    #              or {"players": [10 player dicts], "map": "de_dust2"}
+    #              -> {"p_ct": probability}
+    #   GET /stats -> latency percentiles, throughput and batch sizes
+
+    def __init__(self, batcher, default_map='de_dust2'):
+        self.batcher = batcher
+        self.default_map = default_map
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000, unix_socket=None):
+        await self.batcher.start()
+
+        if unix_socket is not None:
+            self.server = await asyncio.start_unix_server(self._handle,
+                                                          path=unix_socket)
+        else:
+            self.server = await asyncio.start_server(self._handle,
+                                                     host=host,
+                                                     port=port)
+
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def _respond(self, request):
+        method, path, body = request
+
+        if method == 'GET' and path == '/stats':
+            return 200, self.batcher.stats.summary()
+
+        if method != 'POST' or path != '/predict':
+            return 404, {'error': f'No route for {method} {path}'}
+
+        try:
+            payload = json.loads(body)
+
+            if 'features' in payload:
+                features = torch.tensor(payload['features'],
+                                        dtype=torch.float32)
+            else:
+                features = players_to_features(payload['players'],
+                                               payload.get('map',
+                                                           self.default_map))
+        except (ValueError, KeyError, TypeError) as error:
+            return 400, {'error': str(error)}
+
+        # a bad sample would fail the whole batch it ends up in
+        if features.shape != (6, 5, 5):
+            return 400, {'error': 'Features must have shape (6, 5, 5), got '
+                                  f'{tuple(features.shape)}'}
+
+        return 200, {'p_ct': await self.batcher.predict(features)}
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except ValueError as error:
+                    # where the next request starts is unknown, give up on
+                    # the connection
+                    write_message(writer, 'HTTP/1.1 400 Error',
+                                  json.dumps({'error': str(error)}).encode())
+                    await writer.drain()
+                    break
+
+                if request is None:
+                    break
+
+                status, response = await self._respond(request)
+                write_message(writer, f'HTTP/1.1 {status} '
+                              f'{"OK" if status == 200 else "Error"}',
+                              json.dumps(response).encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_message(reader):
+    # (start line, body) of an HTTP message with a Content-Length, None once
+    # the connection is closed. ValueError on a malformed message
+    start_line = await reader.readline()
+
+    if not start_line:
+        return None
+
+    length = 0
+
+    while True:
+        line = await reader.readline()
+
+        if line in [b'\r\n', b'\n', b'']:
+            break
+
+        name, _, value = line.decode().partition(':')
+
+        if name.strip().lower() == 'content-length':
+            try:
+                length = int(value)
+            except ValueError:
+                raise ValueError(f'Invalid Content-Length {value.strip()}')
+
+            if not 0 <= length <= MAX_BODY_SIZE:
+                raise ValueError(f'Content-Length must be between 0 and '
+                                 f'{MAX_BODY_SIZE}, got {length}')
+
+    body = await reader.readexactly(length) if length else b''
+
+    return start_line.decode().strip(), body
+
+
+async def read_request(reader):
+    # (method, path, body)
+    message = await read_message(reader)
+
+    if message is None:
+        return None
+
+    start_line, body = message
+    tokens = start_line.split()
+
+    if len(tokens) < 2:
+        raise ValueError(f'Invalid request line {start_line!r}')
+
+    method, path = tokens[:2]
+
+    return method, path, body
+
+
+def write_message(writer, start_line, body=b''):
+    writer.write(f'{start_line}\r\n'
+                 'Content-Type: application/json\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+
+
+if __name__ == '__main__':
+    import argparse
+    from csgo_wp.model import (add_model_arguments, check_model_arguments,
+                               model_kwargs)
+
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--model',
+                        type=str,
+                        required=True,
+                        )
+
+    # same as in train.py, the model has to be rebuilt the same way. the
+    # server only builds (6, 5, 5) samples, for an lrcnn model
+    add_model_arguments(parser)
+    parser.set_defaults(model_type='lrcnn', transform='channels')
+
+    parser.add_argument('--host',
+                        type=str,
+                        default='127.0.0.1',
+                        )
+
+    parser.add_argument('--port',
+                        type=int,
+                        default=8000,
+                        )
+
+    parser.add_argument('--unix-socket',
+                        type=str,
+                        default=None,
+                        )
+
+    parser.add_argument('--max-batch',
+                        type=int,
+                        default=64,
+                        )
+
+    parser.add_argument('--max-wait-ms',
+                        type=float,
+                        default=2,
+                        )
+
+    parser.add_argument('--map',
+                        type=str,
+                        default='de_dust2',
+                        )
+
+    args = parser.parse_args()
+
+    check_model_arguments(parser, args)
+
+    if (args.model_type, args.transform, args.distances) != ('lrcnn',
+                                                             'channels',
+                                                             'area'):
+        parser.error('The server only serves lrcnn models taking the '
+                     'channels transform with area distances')
+
+    if args.model.endswith('.ts'):
+        # export.py artifact, the model options are ignored
+        model, metadata = load_exported(args.model)
+
+        if tuple(metadata['input_shape']) != (6, 5, 5):
+            parser.error(f'{args.model} takes {metadata["input_shape"]} '
+                         'samples, the server sends (6, 5, 5) ones')
+    else:
+        model = load_model(args.model, args.model_type, **model_kwargs(args))
+
+    async def main():
+        server = PredictionServer(MicroBatcher(model,
+                                               args.max_batch,
+                                               args.max_wait_ms / 1000),
+                                  default_map=args.map)
+        await server.start(args.host, args.port, args.unix_socket)
+
+        print('Listening on '
+              f'{args.unix_socket or f"{args.host}:{args.port}"}')
+
+        try:
+            while True:
+                await asyncio.sleep(10)
+                print(server.batcher.stats.summary())
+        finally:
+            await server.stop()
+
+    asyncio.run(main())
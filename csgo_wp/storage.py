@@ -0,0 +1,348 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import numpy as np
+import pandas as pd
+import torch
+from csgo_wp.ingest import ROUND_KEY
+
+
+TENSOR_STORE_VERSION = 1
+
+
+def save_split(rounds, folder):
+    # all rounds of a split as one table, one .npy file per column, plus the
+    # row offset of every round. categorical/string columns are stored as
+    # codes with their categories in columns.json
+    os.makedirs(folder, exist_ok=True)
+
+    offsets = np.zeros(len(rounds) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([game_round.shape[0] for game_round in rounds])
+
+    np.save(os.path.join(folder, 'round_offsets.npy'), offsets)
+
+    column_info = {}
+
+    if len(rounds) > 0:
+        frames = pd.concat(rounds, ignore_index=True)
+
+        for column in frames.columns:
+            values = frames[column]
+            info = {}
+
+            # rounds of several maps have MapName categories that differ,
+            # concat turns them into plain strings
+            if (isinstance(values.dtype, pd.CategoricalDtype)
+               or pd.api.types.is_string_dtype(values.dtype)):
+                values = values.astype('category')
+                info['categories'] = values.cat.categories.tolist()
+                values = values.cat.codes
+
+            np.save(os.path.join(folder, f'{column}.npy'), values.values)
+            column_info[column] = info
+
+    # written last, an interrupted save has no columns.json
+    with open(os.path.join(folder, 'columns.json'), 'w') as f:
+        json.dump(column_info, f)
+
+
+def split_exists(folder):
+    return os.path.exists(os.path.join(folder, 'columns.json'))
+
+
+def shard_folders(split_folder):
+    # 'frames' from the initial build, then 'frames-1', 'frames-2'... for
+    # every batch of matches appended since, in order
+    names = [name for name in os.listdir(split_folder)
+             if (name == 'frames' or name.startswith('frames-'))
+             and split_exists(os.path.join(split_folder, name))]
+    names.sort(key=lambda name: 0 if name == 'frames'
+               else int(name.split('-')[1]))
+
+    return [os.path.join(split_folder, name) for name in names]
+
+
+def next_shard_folder(split_folder):
+    if not os.path.exists(split_folder):
+        return os.path.join(split_folder, 'frames')
+
+    return os.path.join(split_folder,
+                        f'frames-{len(shard_folders(split_folder))}')
+
+
+class RawSplit:
+    # rounds of one split, read lazily round by round from the memory-mapped
+    # columns written by save_split
+
+    def __init__(self, folder, columns=None):
+        self.folder = folder
+
+        with open(os.path.join(folder, 'columns.json')) as f:
+            self.column_info = json.load(f)
+
+        if columns is None:
+            columns = list(self.column_info)
+
+        self.columns = list(columns)
+        self.offsets = np.load(os.path.join(folder, 'round_offsets.npy'))
+        self._arrays = {}
+
+    def column(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.folder,
+                                                      f'{name}.npy'),
+                                         mmap_mode='r')
+
+        return self._arrays[name]
+
+    def _frame(self, start, end):
+        data = {}
+
+        for name in self.columns:
+            values = np.array(self.column(name)[start:end])
+            categories = self.column_info[name].get('categories')
+
+            if categories is not None:
+                values = pd.Categorical.from_codes(values, categories)
+
+            data[name] = values
+
+        return pd.DataFrame(data)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Round {idx} out of range for {len(self)} '
+                             'rounds')
+
+        return self._frame(self.offsets[idx], self.offsets[idx + 1])
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def table(self):
+        # the whole split as a single DataFrame
+        return self._frame(0, self.offsets[-1])
+
+    def keys(self):
+        # (MatchId, MapName, RoundNum) of every round, from its first row
+        starts = self.offsets[:-1]
+        columns = []
+
+        for name in ROUND_KEY:
+            values = np.asarray(self.column(name))[starts]
+            categories = self.column_info[name].get('categories')
+
+            if categories is not None:
+                values = np.asarray(categories, dtype=object)[values]
+
+            columns.append(values.tolist())
+
+        return list(zip(*columns))
+
+
+class ShardedSplit:
+    # several RawSplit shards seen as a single sequence of rounds
+
+    def __init__(self, folders, columns=None):
+        self.shards = [RawSplit(folder, columns) for folder in folders]
+        self.offsets = np.cumsum([0] + [len(shard) for shard in self.shards])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+
+        if not 0 <= idx < len(self):
+            raise IndexError(f'Round {idx} out of range for {len(self)} '
+                             'rounds')
+
+        shard = np.searchsorted(self.offsets, idx, side='right') - 1
+
+        return self.shards[shard][idx - self.offsets[shard]]
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def table(self):
+        return pd.concat([shard.table() for shard in self.shards],
+                         ignore_index=True)
+
+    def keys(self):
+        return [key for shard in self.shards for key in shard.keys()]
+
+
+class TensorBuffer:
+    # contiguous buffer that samples are appended to, its capacity doubles
+    # whenever it is full. tensor() is a view, not a copy
+
+    def __init__(self, capacity=4096, dtype=torch.float32):
+        self.capacity = capacity
+        self.dtype = dtype
+        self.size = 0
+        self._values = None
+
+    def extend(self, values):
+        n_samples = values.shape[0]
+
+        if self._values is None:
+            self._values = torch.empty((max(self.capacity, n_samples),)
+                                       + tuple(values.shape[1:]),
+                                       dtype=self.dtype)
+        elif self.size + n_samples > self._values.shape[0]:
+            capacity = max(2 * self._values.shape[0], self.size + n_samples)
+            grown = torch.empty((capacity,) + tuple(self._values.shape[1:]),
+                                dtype=self.dtype)
+            grown[:self.size] = self._values[:self.size]
+            self._values = grown
+
+        self._values[self.size:self.size + n_samples] = values
+        self.size += n_samples
+
+    def tensor(self):
+        if self._values is None:
+            return torch.empty(0, dtype=self.dtype)
+
+        return self._values[:self.size]
+
+
+def _named_tensors(data, targets, columns):
+    columns = columns or {}
+
+    return [('data', data), ('targets', targets)] + list(columns.items())
+
+
+def save_tensors(data, targets, file_loc, columns=None):
+    # raw contiguous float32 files plus a JSON header, so they can be
+    # memory-mapped by load_tensors. columns are extra per-sample values
+    # (e.g. the map index) stored the same way, in their own dtype
+    header = {'version': TENSOR_STORE_VERSION, 'columns': []}
+
+    for name, tensor in _named_tensors(data, targets, columns):
+        values = np.ascontiguousarray(tensor.numpy())
+
+        if name in ['data', 'targets']:
+            values = values.astype(np.float32, copy=False)
+        else:
+            header['columns'].append(name)
+
+        values.tofile(f'{file_loc}.{name}.bin')
+
+        header[name] = {'shape': list(values.shape),
+                        'dtype': str(values.dtype),
+                        }
+
+    # written last, an interrupted save has no header
+    with open(f'{file_loc}.json', 'w') as f:
+        json.dump(header, f)
+
+
+def append_tensors(data, targets, file_loc, columns=None, n_samples=None):
+    # adds samples to the end of an existing store, only the header is
+    # rewritten. n_samples: samples the store is known to hold (e.g. by a
+    # manifest written after the header), anything past them is dropped
+    # first, in case an earlier append was interrupted after its header
+    with open(f'{file_loc}.json') as f:
+        header = json.load(f)
+
+    if n_samples is not None:
+        if n_samples > header['data']['shape'][0]:
+            raise ValueError(f'{file_loc} holds {header["data"]["shape"][0]}'
+                             f' samples, expected at least {n_samples}')
+
+        for name in ['data', 'targets'] + header['columns']:
+            header[name]['shape'][0] = n_samples
+
+    named = _named_tensors(data, targets, columns)
+
+    if sorted(name for name, _ in named[2:]) != sorted(header['columns']):
+        raise ValueError(f'Cannot append columns {[n for n, _ in named[2:]]}'
+                         f' to {file_loc} with columns {header["columns"]}')
+
+    for name, tensor in named:
+        values = np.ascontiguousarray(tensor.numpy(),
+                                      dtype=header[name]['dtype'])
+
+        if list(values.shape[1:]) != header[name]['shape'][1:]:
+            raise ValueError(f'Cannot append {name} of shape {values.shape} '
+                             f'to {file_loc} with shape '
+                             f'{header[name]["shape"]}')
+
+        # drop anything past the header from an interrupted append
+        size = np.prod(header[name]['shape']) * values.itemsize
+
+        with open(f'{file_loc}.{name}.bin', 'r+b') as f:
+            f.truncate(size)
+            f.seek(size)
+            f.write(values.tobytes())
+
+        header[name]['shape'][0] += values.shape[0]
+
+    tmp_loc = f'{file_loc}.json.tmp'
+
+    with open(tmp_loc, 'w') as f:
+        json.dump(header, f)
+
+    os.replace(tmp_loc, f'{file_loc}.json')
+
+
+def tensors_exist(file_loc):
+    return os.path.exists(f'{file_loc}.json')
+
+
+def _read_header(file_loc):
+    with open(f'{file_loc}.json') as f:
+        header = json.load(f)
+
+    if header['version'] != TENSOR_STORE_VERSION:
+        raise ValueError(f'{file_loc} has tensor store version '
+                         f'{header["version"]}, expected '
+                         f'{TENSOR_STORE_VERSION}')
+
+    return header
+
+
+def _map_tensor(file_loc, header, name):
+    shape = tuple(header[name]['shape'])
+
+    if np.prod(shape) == 0:
+        values = np.zeros(shape, dtype=header[name]['dtype'])
+    else:
+        values = np.memmap(f'{file_loc}.{name}.bin',
+                           dtype=header[name]['dtype'],
+                           mode='c',
+                           shape=shape,
+                           )
+
+    return torch.from_numpy(values)
+
+
+def load_tensors(file_loc):
+    # (data, targets) backed by the files on disk, so processes opening the
+    # same store share the page cache. copy-on-write keeps the tensors
+    # writable without ever touching the files
+    header = _read_header(file_loc)
+
+    return tuple(_map_tensor(file_loc, header, name)
+                 for name in ['data', 'targets'])
+
+
+def load_column(file_loc, name):
+    # one of the extra columns saved along with the tensors, memory-mapped
+    # like them
+    header = _read_header(file_loc)
+
+    if name not in header.get('columns', []):
+        raise KeyError(f'No column {name} in {file_loc}')
+
+    return _map_tensor(file_loc, header, name)
@@ -1,7 +1,8 @@
 #! /usr/bin/env python3
 
 import torch
-from model import FCNN, CNN, ResNet, LR_CNN, NFL_NN
+from model import (FCNN, MODELS, add_model_arguments, check_model_arguments,
+                   model_kwargs, transform_kwargs)
 from sklearn.metrics import log_loss, roc_auc_score, accuracy_score
 
 
@@ -61,6 +62,30 @@ def test(model, loader, device):
     return roc_auc_score(y_true, y_pred)
 
 
+def make_loader(dataset, batch_size, shuffle):
+    if getattr(dataset, 'compact', None) is None:
+        return torch.utils.data.DataLoader(dataset,
+                                           batch_size=batch_size,
+                                           shuffle=shuffle,
+                                           num_workers=0,
+                                           )
+
+    # compact datasets decode a whole batch of indices at once
+    if shuffle:
+        sampler = torch.utils.data.RandomSampler(dataset)
+    else:
+        sampler = torch.utils.data.SequentialSampler(dataset)
+
+    return torch.utils.data.DataLoader(dataset,
+                                       batch_size=None,
+                                       sampler=torch.utils.data.BatchSampler(
+                                           sampler,
+                                           batch_size,
+                                           drop_last=False),
+                                       num_workers=0,
+                                       )
+
+
 def test_train_functions(train_dataset, val_dataset, test_dataset):
     train_loader = torch.utils.data.DataLoader(train_dataset,
                                                batch_size=64,
@@ -113,6 +138,7 @@ def test_train_functions(train_dataset, val_dataset, test_dataset):
 if __name__ == '__main__':
     from data_transform import CSGODataset, transform_data
     from data_transform import transform_multichannel, transform_nfl
+    from export import export_model
     import sys
     import argparse
     import warnings
@@ -131,77 +157,56 @@ if __name__ == '__main__':
                         default=32,
                         )
 
-    parser.add_argument('--model-type',
-                        type=str,
-                        default='fc',
-                        )
-
-    parser.add_argument('--hidden-sizes',
-                        type=lambda s: [int(item) for item in s.split(',')],
-                        default=[200, 100, 50],
-                        )
-
-    parser.add_argument('--cnn-options',
-                        type=lambda x: tuple(tuple(int(item)
-                                                   for item in s.split(','))
-                                             for s in x.split('|')),
-                        default=((1, 1, 3, 1, 0, 2, 1, 0),),
+    parser.add_argument('--learning-rate',
+                        type=float,
+                        default=0.0001,
                         )
 
-    parser.add_argument('--dropout',
+    parser.add_argument('--verbose',
                         type=bool,
                         default=False,
                         )
 
-    parser.add_argument('--batch-norm',
+    parser.add_argument('--early-stopping',
                         type=bool,
                         default=False,
                         )
 
-    parser.add_argument('--learning-rate',
-                        type=float,
-                        default=0.0001,
+    parser.add_argument('--build-workers',
+                        type=int,
+                        default=0,
                         )
 
-    parser.add_argument('--activation',
-                        type=str,
-                        default='ReLU',
+    parser.add_argument('--compact',
+                        type=bool,
+                        default=False,
                         )
 
-    parser.add_argument('--activation-params',
-                        type=dict,
-                        default={},
+    parser.add_argument('--maps',
+                        type=lambda s: s.split(','),
+                        default=None,
                         )
 
-    parser.add_argument('--verbose',
-                        type=bool,
-                        default=False,
+    add_model_arguments(parser)
+
+    parser.add_argument('--tick-stride',
+                        type=int,
+                        default=None,
                         )
 
-    parser.add_argument('--transform',
-                        type=str,
-                        default='unsorted',
+    parser.add_argument('--tick-seconds',
+                        type=float,
+                        default=None,
                         )
 
-    parser.add_argument('--early-stopping',
+    parser.add_argument('--tick-on-change',
                         type=bool,
                         default=False,
                         )
 
     args = parser.parse_args()
 
-    if args.model_type not in ['fc', 'cnn', 'res', 'lrcnn', 'nfl']:
-        print('Model type not supported, only one of'
-              ' "fc", "cnn", "res", "lrcnn", "nfl" allowed')
-        sys.exit(1)
-
-    if not all([len(x) == 8 for x in args.cnn_options]):
-        print('Invalid CNN options passed in: was missing argument')
-        sys.exit(1)
-
-    if args.activation not in torch.nn.__dict__.keys():
-        print('Invalid activation passed in: does not exist')
-        sys.exit(1)
+    check_model_arguments(parser, args)
 
     if args.n_epochs < 1:
         print('Invalid number of epochs passed in: must be greater than 1')
@@ -215,35 +220,52 @@ if __name__ == '__main__':
         print('Invalid learning rate passed in: must be positive')
         sys.exit(1)
 
-    if args.transform not in ['unsorted', 'channels', 'nfl']:
-        print('Invalid transform passed')
-        sys.exit(1)
-
     transforms = {'unsorted': transform_data,
                   'channels': transform_multichannel,
                   'nfl': transform_nfl,
                   }
 
-    input_sizes = {'unsorted': (1, 12, 10),
-                   'channels': (6, 5, 5),
-                   'nfl': tuple(),
-                   }
+    transform_options = transform_kwargs(args)
 
     transform = transforms[args.transform]
 
+    # the other ticks of a round are skipped, see ingest.select_ticks
+    tick_selection = {'stride': args.tick_stride,
+                      'seconds': args.tick_seconds,
+                      'on_change': args.tick_on_change,
+                      }
+    tick_selection = {option: value
+                      for option, value in tick_selection.items()
+                      if value not in [None, False]}
+
     train_dataset = CSGODataset(transform=transform,
                                 dataset_split='train',
                                 verbose=args.verbose,
+                                num_workers=args.build_workers,
+                                compact=args.compact,
+                                maps=args.maps,
+                                tick_selection=tick_selection,
+                                transform_options=transform_options,
                                 )
 
     val_dataset = CSGODataset(transform=transform,
                               dataset_split='val',
                               verbose=args.verbose,
+                              num_workers=args.build_workers,
+                              compact=args.compact,
+                              maps=args.maps,
+                              tick_selection=tick_selection,
+                              transform_options=transform_options,
                               )
 
     test_dataset = CSGODataset(transform=transform,
                                dataset_split='test',
                                verbose=args.verbose,
+                               num_workers=args.build_workers,
+                               compact=args.compact,
+                               maps=args.maps,
+                               tick_selection=tick_selection,
+                               transform_options=transform_options,
                                )
 
     if len(sys.argv) < 2:
@@ -251,39 +273,11 @@ if __name__ == '__main__':
         sys.exit()
 
     # implicit else
-    train_loader = torch.utils.data.DataLoader(train_dataset,
-                                               batch_size=args.batch_size,
-                                               shuffle=True,
-                                               num_workers=0,
-                                               )
-
-    val_loader = torch.utils.data.DataLoader(val_dataset,
-                                             batch_size=args.batch_size,
-                                             shuffle=False,
-                                             num_workers=0,
-                                             )
+    train_loader = make_loader(train_dataset, args.batch_size, shuffle=True)
+    val_loader = make_loader(val_dataset, args.batch_size, shuffle=False)
+    test_loader = make_loader(test_dataset, args.batch_size, shuffle=False)
 
-    test_loader = torch.utils.data.DataLoader(test_dataset,
-                                              batch_size=args.batch_size,
-                                              shuffle=False,
-                                              num_workers=0,
-                                              )
-
-    models = {'fc': FCNN,
-              'cnn': CNN,
-              'res': ResNet,
-              'lrcnn': LR_CNN,
-              'nfl': NFL_NN,
-              }
-
-    model = models[args.model_type](input_size=input_sizes[args.transform],
-                                    hidden_sizes=args.hidden_sizes,
-                                    activation=args.activation,
-                                    activation_params=args.activation_params,
-                                    dropout=args.dropout,
-                                    batch_norm=args.batch_norm,
-                                    cnn_options=args.cnn_options,
-                                    )
+    model = MODELS[args.model_type](**model_kwargs(args))
 
     device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
 
@@ -328,8 +322,37 @@ if __name__ == '__main__':
          device=device,
          )
 
+    if args.compact:
+        # metrics should match the ones on the full precision features
+        print('\nTest set results on float32 features')
+
+        float_test_dataset = CSGODataset(transform=transform,
+                                         dataset_split='test',
+                                         verbose=args.verbose,
+                                         maps=args.maps,
+                                         tick_selection=tick_selection,
+                                         transform_options=transform_options,
+                                         )
+
+        test(model=model,
+             loader=make_loader(float_test_dataset,
+                                args.batch_size,
+                                shuffle=False),
+             device=device,
+             )
+
     random_number = random.random()
 
     torch.save(model.state_dict(), f'model-{random_number:.5f}.pt')
 
     print(f'Saved to model-{random_number:.5f}.pt')
+
+    # loads with export.load_exported, without rebuilding the model
+    export_model(model,
+                 f'model-{random_number:.5f}.ts',
+                 transform.__name__,
+                 transform_options,
+                 model_type=args.model_type,
+                 model_options=model_kwargs(args))
+
+    print(f'Exported to model-{random_number:.5f}.ts')
@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import pytest
+import csgo_wp.distance_table
+from csgo_wp.ingest import FRAMES_COLUMNS
+
+
+def _make_round(n_ticks, seed=0, match_id=1, map_name='de_test',
+                round_num=1, n_players=10):
+    rng = np.random.default_rng(seed)
+
+    steam_ids = rng.permutation(np.arange(76561198000000000,
+                                          76561198000000010))
+    sides = ['CT', 'T'] * 5
+
+    rows = []
+    for tick in range(n_ticks):
+        for steam_id, side in list(zip(steam_ids, sides))[:n_players]:
+            rows.append({'MatchId': match_id,
+                         'MapName': map_name,
+                         'RoundNum': round_num,
+                         'Tick': 100 + 8 * tick,
+                         'Second': tick / 8,
+                         'PlayerSteamId': steam_id,
+                         'Side': side,
+                         'X': rng.normal(),
+                         'Y': rng.normal(),
+                         'Z': rng.normal(),
+                         'AreaId': int(rng.integers(1, 30)),
+                         'IsAlive': bool(rng.random() > 0.3),
+                         'Hp': int(rng.integers(0, 101)),
+                         'Armor': int(rng.integers(0, 101)),
+                         'EqValue': int(rng.integers(0, 5000)),
+                         'DistToBombsiteA': rng.random() * 100,
+                         'DistToBombsiteB': rng.random() * 100,
+                         })
+
+    # rows aren't guaranteed to be sorted in the raw data
+    return pd.DataFrame(rows).sample(frac=1, random_state=seed)
+
+
+@pytest.fixture
+def make_round():
+    return _make_round
+
+
+@pytest.fixture
+def game_map(monkeypatch):
+    rng = np.random.default_rng(13)
+    table = rng.integers(0, 50, size=(30, 30)).astype(np.float32)
+
+    for name in ['de_test', 'de_dust2', 'de_mirage']:
+        monkeypatch.setitem(csgo_wp.distance_table._tables,
+                            (name, csgo_wp.distance_table.DATA_FOLDER),
+                            table)
+
+    return 'de_test'
+
+
+@pytest.fixture
+def raw_folder(tmp_path, game_map):
+    # a few matches in the same format as the raw csgo CSVs, plus one round
+    # with a missing player that should be dropped
+    frames = []
+    outcomes = []
+    seed = 0
+
+    for match_id in range(1, 9):
+        for round_num in range(1, 4):
+            seed += 1
+            n_players = 9 if (match_id, round_num) == (2, 2) else 10
+            frames.append(_make_round(3 + seed % 4, seed,
+                                      match_id=match_id,
+                                      map_name='de_dust2',
+                                      round_num=round_num,
+                                      n_players=n_players))
+            outcomes.append({'MatchId': match_id,
+                             'MapName': 'de_dust2',
+                             'RoundNum': round_num,
+                             'WinningSide': 'CT' if seed % 3 else 'T',
+                             })
+
+    frames = pd.concat(frames).reindex(columns=FRAMES_COLUMNS, fill_value=0)
+    frames.to_csv(tmp_path / 'csgo_playerframes_dust2.csv',
+                  header=False, index=False)
+
+    pd.DataFrame(outcomes).to_csv(tmp_path / 'csgo_rounds_dust2.csv',
+                                  index=False)
+
+    return f'{tmp_path}/'
@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+
+import pytest
+import torch
+from csgo_wp.cache import TransformCache, cache_key
+from csgo_wp.data_transform import (transform_data, transform_multichannel,
+                                    transform_dependencies)
+from csgo_wp.distance_table import lookup_distances
+from csgo_wp.features import _distance_matrices
+
+
+class Test_TransformCache:
+
+    def test_key(self):
+        key = cache_key(transform_multichannel, 'de_dust2')
+
+        assert key == cache_key(transform_multichannel, 'de_dust2')
+        assert key != cache_key(transform_data, 'de_dust2')
+        assert key != cache_key(transform_multichannel, 'de_mirage')
+        assert key != cache_key(transform_multichannel, 'de_dust2',
+                                map_fingerprint='abc')
+        assert key != cache_key(transform_multichannel, 'de_dust2',
+                                params={'stride': 2})
+
+    def test_dependencies(self):
+        dependencies = transform_dependencies(transform_multichannel)
+
+        # not only the features function, also the helpers it calls
+        assert _distance_matrices in dependencies
+        assert lookup_distances in dependencies
+
+    def test_eviction(self, tmp_path):
+        cache = TransformCache(tmp_path, max_entries=2)
+
+        for key in ['a', 'b', 'c']:
+            cache.save(key, torch.rand(size=(3, 6, 5, 5)), torch.ones(3),
+                       {'name': 'frames'})
+
+        assert 'a' not in cache
+        assert 'b' in cache and 'c' in cache
+        assert not (tmp_path / 'a.data.bin').exists()
+
+        data, targets = cache.load('b')
+
+        assert data.shape == (3, 6, 5, 5)
+
+    def test_append(self, tmp_path):
+        cache = TransformCache(tmp_path)
+        data = torch.rand(size=(5, 6, 5, 5))
+
+        cache.save('a', data[:3], torch.ones(3), {'name': 'frames'})
+        cache.append('a', data[3:], torch.zeros(2), {'name': 'frames-1'})
+
+        loaded_data, loaded_targets = cache.load('a')
+
+        assert torch.equal(loaded_data, data)
+        assert loaded_targets.tolist() == [1, 1, 1, 0, 0]
+        assert cache.shards('a')[1]['samples'] == [3, 5]
+
+    def test_interrupted_append(self, tmp_path, monkeypatch):
+        cache = TransformCache(tmp_path)
+        data = torch.rand(size=(5, 6, 5, 5))
+        map_index = torch.arange(5, dtype=torch.int16)
+
+        cache.save('a', data[:3], torch.ones(3), {'name': 'frames'},
+                   columns={'map_index': map_index[:3]})
+
+        # the header is committed, the process dies before the manifest
+        def crash(manifest):
+            raise KeyboardInterrupt
+
+        with monkeypatch.context() as patch:
+            patch.setattr(cache, '_write_manifest', crash)
+
+            with pytest.raises(KeyboardInterrupt):
+                cache.append('a', data[3:], torch.zeros(2),
+                             {'name': 'frames-1'},
+                             columns={'map_index': map_index[3:]})
+
+        assert cache.load('a')[0].shape[0] == 3
+
+        # the next build appends the same shard again
+        cache.append('a', data[3:], torch.zeros(2), {'name': 'frames-1'},
+                     columns={'map_index': map_index[3:]})
+
+        loaded_data, loaded_targets = cache.load('a')
+
+        assert torch.equal(loaded_data, data)
+        assert loaded_targets.tolist() == [1, 1, 1, 0, 0]
+        assert torch.equal(cache.load_column('a', 'map_index'), map_index)
+
+    def test_load_read_only(self, tmp_path, monkeypatch):
+        cache = TransformCache(tmp_path)
+        cache.save('a', torch.rand(size=(3, 6, 5, 5)), torch.ones(3),
+                   {'name': 'frames'})
+
+        # root can write anywhere, fail the manifest write instead
+        def read_only(*args):
+            raise PermissionError('Read-only file system')
+
+        monkeypatch.setattr('csgo_wp.cache.os.replace', read_only)
+
+        data, targets = cache.load('a')
+
+        assert data.shape == (3, 6, 5, 5)
@@ -0,0 +1,347 @@
+#! /usr/bin/env python3
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from csgo_wp.data_transform import (CSGODataset, transform_data,
+                                    transform_multichannel, transform_nfl,
+                                    CSGOIterableDataset, append_matches)
+from csgo_wp.features import encode_multichannel
+from csgo_wp.ingest import FRAMES_COLUMNS
+
+
+@pytest.mark.filterwarnings('ignore')
+class Test_CSGODataset:
+
+    def test_build(self, raw_folder):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+
+        data, target = dataset[0]
+
+        assert len(dataset) > 0
+        assert data.shape == (6, 5, 5)
+        assert target.item() in (0, 1)
+
+    def test_parallel_build_matches(self, raw_folder, tmp_path):
+        sequential = CSGODataset(folder=raw_folder,
+                                 transform=transform_multichannel,
+                                 dataset_split='train')
+
+        # same raw splits, transformed again with a process pool
+        shutil.rmtree(tmp_path / 'train' / 'transformed')
+
+        parallel = CSGODataset(folder=raw_folder,
+                               transform=transform_multichannel,
+                               dataset_split='train',
+                               num_workers=2)
+
+        assert torch.equal(sequential.data, parallel.data)
+        assert torch.equal(sequential.targets, parallel.targets)
+
+    def test_transform_options(self, raw_folder, tmp_path):
+        options = {'distances': 'both'}
+
+        default = CSGODataset(folder=raw_folder,
+                              transform=transform_nfl,
+                              dataset_split='train')
+        sequential = CSGODataset(folder=raw_folder,
+                                 transform=transform_nfl,
+                                 dataset_split='train',
+                                 transform_options=options)
+        sequential_data = sequential.data.clone()
+
+        assert sequential_data.shape[1:] == (8, 5, 5)
+        assert torch.equal(sequential_data[:, :7], default.data)
+
+        shutil.rmtree(tmp_path / 'train' / 'transformed')
+
+        parallel = CSGODataset(folder=raw_folder,
+                               transform=transform_nfl,
+                               dataset_split='train',
+                               transform_options=options,
+                               num_workers=2)
+
+        assert torch.equal(parallel.data, sequential_data)
+
+    def test_cache_reuse(self, raw_folder, tmp_path):
+        CSGODataset(folder=raw_folder,
+                    transform=transform_multichannel,
+                    dataset_split='val')
+        CSGODataset(folder=raw_folder,
+                    transform=transform_multichannel,
+                    dataset_split='val')
+
+        # only the split that was asked for gets built, once: manifest,
+        # header, data, targets, map index and ticks
+        assert len(os.listdir(tmp_path / 'val' / 'transformed')) == 6
+        assert not (tmp_path / 'train' / 'transformed').exists()
+
+    def test_outcomes_change(self, raw_folder, tmp_path):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='val')
+
+        # a corrected outcomes CSV, every round flipped
+        outcomes = pd.read_csv(tmp_path / 'csgo_rounds_dust2.csv')
+        outcomes['WinningSide'] = outcomes['WinningSide'].map({'CT': 'T',
+                                                               'T': 'CT'})
+        outcomes.to_csv(tmp_path / 'csgo_rounds_dust2.csv', index=False)
+
+        rebuilt = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='val')
+
+        assert torch.equal(rebuilt.targets, 1 - dataset.targets)
+
+    def test_append_matches(self, raw_folder, tmp_path, make_round):
+        before = CSGODataset(folder=raw_folder,
+                             transform=transform_multichannel,
+                             dataset_split='train')
+        n_samples = len(before)
+        old_data = before.data.clone()
+
+        # one match that is already there, and a batch of new ones
+        frames = [make_round(4, 1, match_id=1, map_name='de_dust2')]
+        outcomes = []
+        for match_id in range(100, 120):
+            frames.append(make_round(4, match_id, match_id=match_id,
+                                     map_name='de_dust2'))
+            outcomes.append({'MatchId': match_id,
+                             'MapName': 'de_dust2',
+                             'RoundNum': 1,
+                             'WinningSide': 'CT'})
+
+        pd.concat(frames).reindex(columns=FRAMES_COLUMNS, fill_value=0).to_csv(
+            tmp_path / 'new_frames.csv', header=False, index=False)
+        pd.DataFrame(outcomes).to_csv(tmp_path / 'csgo_rounds_dust2.csv',
+                                      mode='a', header=False, index=False)
+
+        appended = append_matches(raw_folder, tmp_path / 'new_frames.csv')
+
+        assert sum(appended.values()) == 20
+
+        after = CSGODataset(folder=raw_folder,
+                            transform=transform_multichannel,
+                            dataset_split='train')
+
+        assert len(after) == n_samples + 4 * appended['train']
+        assert torch.equal(after.data[:n_samples], old_data)
+        assert after.targets[n_samples:].eq(1).all()
+
+    def test_multiple_maps(self, raw_folder, tmp_path, make_round):
+        single = CSGODataset(folder=raw_folder,
+                             transform=transform_multichannel,
+                             dataset_split='train')
+        single_data = single.data.clone()
+
+        for split in ['train', 'val', 'test']:
+            shutil.rmtree(tmp_path / split)
+        os.remove(tmp_path / 'maps.json')
+
+        frames = []
+        outcomes = []
+        for match_id in range(1, 7):
+            frames.append(make_round(3, 50 + match_id, match_id=match_id,
+                                     map_name='de_mirage'))
+            outcomes.append({'MatchId': match_id,
+                             'MapName': 'de_mirage',
+                             'RoundNum': 1,
+                             'WinningSide': 'T'})
+
+        pd.concat(frames).reindex(columns=FRAMES_COLUMNS, fill_value=0).to_csv(
+            tmp_path / 'csgo_playerframes_mirage.csv', header=False,
+            index=False)
+        pd.DataFrame(outcomes).to_csv(tmp_path / 'csgo_rounds_mirage.csv',
+                                      index=False)
+
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train',
+                              maps=['de_dust2', 'de_mirage'])
+
+        assert dataset.maps == ['de_dust2', 'de_mirage']
+        assert set(dataset.map_index.tolist()) == {0, 1}
+        assert dataset.targets[dataset.map_index == 1].eq(0).all()
+
+        # dust2 matches come first, so they end up in the same splits
+        assert torch.equal(dataset.data[dataset.map_index == 0], single_data)
+
+        with pytest.raises(ValueError):
+            CSGODataset(folder=raw_folder,
+                        transform=transform_multichannel,
+                        maps=['de_mirage'])
+
+    def test_tick_selection(self, raw_folder):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+        strided = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train',
+                              tick_selection={'stride': 2})
+
+        assert len(strided) < len(dataset)
+        assert strided.ticks.shape == strided.targets.shape
+        assert ((strided.ticks - 100) % 16 == 0).all()
+
+        # same samples as the ones of the full dataset at those ticks
+        kept = torch.isin(dataset.ticks, strided.ticks)
+        assert torch.equal(strided.data, dataset.data[kept])
+
+    def test_split_without_second(self, raw_folder):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+
+        # as saved before Second was kept, or converted from a .pckl
+        frames_loc = f'{raw_folder}train/frames'
+        os.remove(f'{frames_loc}/Second.npy')
+
+        with open(f'{frames_loc}/columns.json') as f:
+            column_info = json.load(f)
+
+        del column_info['Second']
+
+        with open(f'{frames_loc}/columns.json', 'w') as f:
+            json.dump(column_info, f)
+
+        shutil.rmtree(f'{raw_folder}train/transformed')
+
+        rebuilt = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+        strided = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train',
+                              tick_selection={'stride': 2})
+
+        assert torch.equal(rebuilt.data, dataset.data)
+        assert torch.equal(rebuilt.ticks, dataset.ticks)
+        assert len(strided) < len(rebuilt)
+
+        with pytest.raises(ValueError, match='Rebuild the split'):
+            CSGODataset(folder=raw_folder,
+                        transform=transform_multichannel,
+                        dataset_split='train',
+                        tick_selection={'seconds': 0.5})
+
+    @pytest.mark.parametrize('transform', [transform_data,
+                                           transform_multichannel,
+                                           transform_nfl])
+    def test_compact(self, raw_folder, transform):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform,
+                              dataset_split='train')
+        compact = CSGODataset(folder=raw_folder,
+                              transform=transform,
+                              dataset_split='train',
+                              compact=True)
+
+        report = compact.storage_report
+        assert report['compact_bytes'] < 0.6 * report['float32_bytes']
+
+        data, targets = compact[[0, 2, 5]]
+        assert torch.equal(targets, dataset.targets[[0, 2, 5]])
+        assert torch.allclose(data, dataset.data[[0, 2, 5]],
+                              rtol=1e-3, atol=0.1)
+        assert torch.allclose(compact[len(compact) - 1][0], dataset.data[-1],
+                              rtol=1e-3, atol=0.1)
+
+        if transform is not transform_nfl:
+            # integer distances and 0/1 flags round trip exactly
+            assert report['max_abs_error'] == 0
+
+    def test_compact_blocks(self, raw_folder):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+
+        # one block whose distances need a coarser scale than the others'
+        # (the data is copy-on-write, the cache isn't touched)
+        dataset.data[10:14, :4] = torch.rand(size=(4, 4, 5, 5)) * 1e5
+
+        for data in [dataset.data[:10], dataset.data]:
+            dataset.data = data
+
+            whole = encode_multichannel(data.numpy())
+            blocks = dataset._encode_blocks(encode_multichannel,
+                                            block_size=3)
+
+            assert blocks.keys() == whole.keys()
+
+            for name in whole:
+                np.testing.assert_array_equal(blocks[name], whole[name])
+
+    def test_compact_rebuild(self, raw_folder):
+        CSGODataset(folder=raw_folder,
+                    transform=transform_multichannel,
+                    dataset_split='train',
+                    compact=True)
+
+        # same rounds and samples, different areas
+        area_loc = f'{raw_folder}train/frames/AreaId.npy'
+        area_ids = np.load(area_loc)
+        np.save(area_loc, area_ids % 7 + 1)
+
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+        compact = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train',
+                              compact=True)
+
+        assert torch.equal(compact[:][0], dataset.data)
+
+
+@pytest.mark.filterwarnings('ignore')
+class Test_CSGOIterableDataset:
+
+    @pytest.mark.parametrize('pretransformed', [False, True])
+    @pytest.mark.parametrize('num_workers', [0, 2])
+    def test_same_samples(self, raw_folder, pretransformed, num_workers):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train')
+
+        streamed = CSGOIterableDataset(folder=raw_folder,
+                                       transform=transform_multichannel,
+                                       dataset_split='train',
+                                       shuffle_buffer=5,
+                                       pretransformed=pretransformed,
+                                       block_size=3)
+
+        loader = torch.utils.data.DataLoader(streamed,
+                                             batch_size=4,
+                                             num_workers=num_workers)
+
+        data = torch.cat([batch for batch, _ in loader])
+
+        # same samples, in a different order
+        assert data.shape == dataset.data.shape
+        assert not torch.equal(data, dataset.data)
+        assert torch.equal(data.flatten(1).sum(1).sort().values,
+                           dataset.data.flatten(1).sum(1).sort().values)
+
+    @pytest.mark.parametrize('pretransformed', [False, True])
+    def test_tick_selection(self, raw_folder, pretransformed):
+        dataset = CSGODataset(folder=raw_folder,
+                              transform=transform_multichannel,
+                              dataset_split='train',
+                              tick_selection={'stride': 2})
+
+        streamed = CSGOIterableDataset(folder=raw_folder,
+                                       transform=transform_multichannel,
+                                       dataset_split='train',
+                                       pretransformed=pretransformed,
+                                       tick_selection={'stride': 2})
+
+        data = torch.stack([sample for sample, _ in streamed])
+
+        assert torch.equal(data, dataset.data)
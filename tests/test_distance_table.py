@@ -0,0 +1,185 @@
+#! /usr/bin/env python3
+
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import csgo_wp.distance_table
+from csgo_wp.distance_table import (build_distance_table, lookup_distances,
+                                    save_distance_table, get_distance_table,
+                                    graph_distance_table, build_map_table,
+                                    UNREACHABLE)
+
+
+class Test_DistanceTable:
+
+    def test_build_and_lookup(self, tmp_path):
+        csv_loc = tmp_path / 'distance_infos.csv'
+        pd.DataFrame({'map': ['de_dust2'] * 4 + ['de_mirage'],
+                      'areaId_1': [1, 1, 3, 3, 1],
+                      'areaId_2': [1, 3, 1, 3, 3],
+                      'graph_distance': [0, 7.5, 7.5, 0, 100],
+                      }).to_csv(csv_loc, index=False)
+
+        table = build_distance_table(csv_loc, 'de_dust2')
+
+        assert table.shape == (4, 4)
+        assert table[1, 3] == 7.5
+        assert table[2, 1] == UNREACHABLE
+
+        areas = np.array([[1, 3], [3, 3]])
+        result = lookup_distances(table, areas)
+
+        assert result.shape == (2, 2, 2)
+        np.testing.assert_array_equal(result[0], [[0, 7.5], [7.5, 0]])
+        np.testing.assert_array_equal(result[1], [[0, 0], [0, 0]])
+
+    def test_bounded_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(csgo_wp.distance_table, 'MAX_TABLES', 2)
+        monkeypatch.setattr(csgo_wp.distance_table, '_tables',
+                            csgo_wp.distance_table.OrderedDict())
+
+        for idx, name in enumerate(['de_a', 'de_b', 'de_c']):
+            save_distance_table(np.full((3, 3), idx, dtype=np.float32),
+                                name, tmp_path)
+
+        get_distance_table('de_a', tmp_path)
+        get_distance_table('de_b', tmp_path)
+        get_distance_table('de_a', tmp_path)
+        table = get_distance_table('de_c', tmp_path)
+
+        # de_b was the least recently used
+        assert table[0, 0] == 2
+        cached = list(csgo_wp.distance_table._tables)
+        assert cached == [('de_a', tmp_path), ('de_c', tmp_path)]
+
+    @pytest.mark.parametrize('num_workers', [0, 2])
+    def test_graph_distances(self, num_workers):
+        # only the graph tests need networkx
+        nx = pytest.importorskip('networkx')
+
+        graph = nx.DiGraph()
+        graph.add_edges_from([(1, 2), (2, 3), (3, 1), (3, 5), (5, 3)])
+        graph.add_node(7)
+
+        table = graph_distance_table(graph,
+                                     num_workers=num_workers,
+                                     sources_per_task=2)
+
+        assert table.shape == (8, 8)
+
+        for source in graph.nodes:
+            for target in graph.nodes:
+                if nx.has_path(graph, source, target):
+                    expected = nx.shortest_path_length(graph, source, target)
+                else:
+                    expected = UNREACHABLE
+
+                assert table[source, target] == expected
+
+        # not an area
+        assert table[4, 4] == UNREACHABLE
+
+    def test_same_as_csv_tables(self, tmp_path):
+        # graph_distance_table replaces the tables built from
+        # distance_infos.csv, the models were trained on those
+        nx = pytest.importorskip('networkx')
+
+        graph = nx.DiGraph()
+        graph.add_edges_from([(1, 2), (2, 3), (3, 1), (3, 5), (5, 3),
+                              (5, 6), (2, 6)])
+        graph.add_node(7)
+
+        # what calc-distances.py wrote, one row per pair of AreaIds: csgo's
+        # area_distance, the number of hops of the shortest path
+        rows = []
+        for area_one in range(1, 8):
+            for area_two in range(1, 8):
+                try:
+                    distance = len(nx.bidirectional_shortest_path(
+                        graph, area_one, area_two)) - 1
+                except (nx.NetworkXNoPath, nx.NodeNotFound):
+                    distance = 'None'
+
+                rows.append({'map': 'de_test',
+                             'areaId_1': area_one,
+                             'areaId_2': area_two,
+                             'graph_distance': distance,
+                             })
+
+        pd.DataFrame(rows).to_csv(tmp_path / 'distance_infos.csv',
+                                  index=False)
+
+        expected = build_distance_table(tmp_path / 'distance_infos.csv',
+                                        'de_test')
+
+        np.testing.assert_array_equal(graph_distance_table(graph), expected)
+
+    def test_resume(self, tmp_path, monkeypatch):
+        nx = pytest.importorskip('networkx')
+
+        graph = nx.random_regular_graph(3, 40, seed=1).to_directed()
+        graph = nx.relabel_nodes(graph, {node: node * 2 + 3
+                                         for node in graph.nodes})
+        expected = graph_distance_table(graph)
+
+        monkeypatch.setattr(csgo_wp.distance_table, '_tables',
+                            csgo_wp.distance_table.OrderedDict())
+
+        computed = []
+        source_distances = csgo_wp.distance_table._source_distances
+
+        def interrupted(sources):
+            if len(computed) == 3:
+                raise KeyboardInterrupt
+            computed.extend(sources)
+            return source_distances(sources)
+
+        monkeypatch.setattr(csgo_wp.distance_table, '_source_distances',
+                            interrupted)
+
+        with pytest.raises(KeyboardInterrupt):
+            build_map_table('de_test', graph, tmp_path, sources_per_task=1)
+
+        assert (tmp_path / 'distances_de_test.partial').exists()
+        assert not (tmp_path / 'distances_de_test.npy').exists()
+
+        # only the rows that weren't done are computed again
+        computed.clear()
+        monkeypatch.setattr(csgo_wp.distance_table, '_source_distances',
+                            lambda sources: (computed.extend(sources),
+                                             source_distances(sources))[1])
+
+        table = build_map_table('de_test', graph, tmp_path,
+                                sources_per_task=4)
+
+        assert len(computed) == 37
+        np.testing.assert_array_equal(table, expected)
+        np.testing.assert_array_equal(get_distance_table('de_test', tmp_path),
+                                      expected)
+        assert not (tmp_path / 'distances_de_test.partial').exists()
+
+        with open(tmp_path / 'distances_de_test.json') as f:
+            metadata = json.load(f)
+
+        assert metadata['map'] == 'de_test'
+        assert metadata['unreachable'] == UNREACHABLE
+        assert metadata['area_ids'] == sorted(graph.nodes)
+
+    def test_parallel_build_progress(self, tmp_path, capsys):
+        nx = pytest.importorskip('networkx')
+
+        graph = nx.random_regular_graph(3, 60, seed=2).to_directed()
+
+        table = build_map_table('de_test', graph, tmp_path, num_workers=2,
+                                sources_per_task=4, verbose=True)
+
+        np.testing.assert_array_equal(table, graph_distance_table(graph))
+
+        with open(tmp_path / 'distances_de_test.json') as f:
+            build = json.load(f)['build']
+
+        assert build['pairs'] == build['total_pairs'] == 60 * 60
+        assert build['pending_batches'] == build['queued_batches'] == 0
+        assert 1 <= len(build['worker_pairs_per_second']) <= 2
+        assert '3600/3600 pairs' in capsys.readouterr().out
@@ -0,0 +1,41 @@
+#! /usr/bin/env python3
+
+import pytest
+import torch
+from csgo_wp.export import export_model, load_exported
+from csgo_wp.model import FCNN, LR_CNN, NFL_NN
+
+
+class Test_export_model:
+
+    @pytest.mark.parametrize('model_class, transform, options, shape', [
+        (FCNN, 'transform_data', {}, (1, 12, 10)),
+        (LR_CNN, 'transform_multichannel', {}, (6, 5, 5)),
+        (FCNN, 'transform_multichannel', {'distances': 'both'}, (10, 5, 5)),
+        (NFL_NN, 'transform_nfl', {}, (7, 5, 5)),
+    ])
+    def test_round_trip(self, tmp_path, model_class, transform, options,
+                        shape):
+        torch.manual_seed(0)
+        model = model_class(input_size=shape,
+                            hidden_sizes=[20, 10],
+                            batch_norm=True,
+                            dropout=True).eval()
+
+        export_model(model, tmp_path / 'model.ts', transform, options,
+                     model_type='test', model_options={'hidden_sizes': [20]})
+
+        loaded, metadata = load_exported(tmp_path / 'model.ts')
+
+        assert not loaded.training
+        assert metadata['transform'] == transform
+        assert metadata['transform_options'] == options
+        assert tuple(metadata['input_shape']) == shape
+        assert metadata['model_class'] == model_class.__name__
+        assert metadata['model_options'] == {'hidden_sizes': [20]}
+
+        # a different batch size than the one it was traced with
+        x = torch.rand((17,) + shape)
+
+        with torch.no_grad():
+            torch.testing.assert_close(loaded(x), model(x))
@@ -2,6 +2,7 @@
 
 import torch
 import csgo_wp
+from csgo_wp.data_transform import transform_multichannel
 
 
 class Test_CNN:
@@ -14,3 +15,15 @@ class Test_CNN:
         result = mod(t)
 
         assert result.shape == (5, 2)
+
+
+class Test_LR_CNN:
+
+    def test_both_distances(self, game_map, make_round):
+        features = transform_multichannel(make_round(4), game_map,
+                                          distances='both')
+
+        mod = csgo_wp.LR_CNN(input_size=(10, 5, 5), hidden_sizes=[20, 10])
+
+        assert mod.conv_blocks[0].conv.in_channels == 8
+        assert mod.eval()(features).shape == (4,)
@@ -0,0 +1,66 @@
+#! /usr/bin/env python3
+
+import pandas as pd
+import pytest
+from csgo_wp.ingest import (stream_rounds, load_outcomes, round_targets,
+                            select_ticks, tick_columns)
+
+
+class Test_Ingest:
+
+    def test_chunk_size_independent(self, raw_folder):
+        file_loc = raw_folder + 'csgo_playerframes_dust2.csv'
+
+        whole = list(stream_rounds(file_loc, chunk_size=None))
+        chunked = list(stream_rounds(file_loc, chunk_size=7))
+
+        assert len(whole) == len(chunked) == 24
+
+        for (a, a_valid), (b, b_valid) in zip(whole, chunked):
+            assert a_valid == b_valid
+            pd.testing.assert_frame_equal(a.reset_index(drop=True),
+                                          b.reset_index(drop=True),
+                                          check_categorical=False)
+
+        assert sum(not valid for _, valid in chunked) == 1
+
+    def test_round_targets(self, raw_folder):
+        outcomes = load_outcomes(raw_folder + 'csgo_rounds_dust2.csv')
+
+        targets = round_targets(outcomes, [(1, 'de_dust2', 1),
+                                           (3, 'de_dust2', 3)])
+
+        assert targets.tolist() == [1, 0]
+
+        with pytest.raises(KeyError):
+            round_targets(outcomes, [(99, 'de_dust2', 1)])
+
+    def test_select_ticks(self, make_round):
+        game_round = make_round(10)
+        ticks = sorted(game_round['Tick'].unique())
+
+        assert select_ticks(game_round).tolist() == ticks
+        assert select_ticks(game_round, stride=3).tolist() == ticks[::3]
+
+        # 8 ticks per second
+        assert select_ticks(game_round, seconds=0.5).tolist() == ticks[::4]
+
+        # only the columns each selection needs
+        for options in [{}, {'stride': 3}, {'seconds': 0.5}]:
+            assert select_ticks(game_round[tick_columns(**options)],
+                                **options).tolist() == select_ticks(
+                game_round, **options).tolist()
+
+        # nobody moves or dies from the 3rd to the 6th tick
+        frozen = game_round['Tick'].isin(ticks[2:6])
+        first = game_round[game_round['Tick'] == ticks[2]]
+        areas = first.set_index('PlayerSteamId')['AreaId']
+        game_round.loc[frozen, 'AreaId'] = game_round.loc[
+            frozen, 'PlayerSteamId'].map(areas)
+        game_round.loc[frozen, 'IsAlive'] = True
+
+        assert select_ticks(game_round, on_change=True).tolist() == (
+            ticks[:3] + ticks[6:])
+
+        with pytest.raises(ValueError):
+            select_ticks(game_round, stride=2, on_change=True)
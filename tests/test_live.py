@@ -0,0 +1,59 @@
+#! /usr/bin/env python3
+
+import numpy as np
+import torch
+from csgo_wp.data_transform import transform_multichannel, transform_nfl
+from csgo_wp.features import NFL_ATTRIBUTES
+from csgo_wp.live import LiveRoundState
+
+
+class Test_LiveRoundState:
+
+    def test_matches_transforms(self, game_map, make_round):
+        game_round = make_round(12, seed=3)
+        game_round = game_round.sort_values(['Tick', 'PlayerSteamId'],
+                                            ignore_index=True)
+
+        # on every other tick, 6 of the players keep their values from the
+        # tick before, and their rows aren't sent to the live state
+        tick_idx = np.arange(game_round.shape[0]) // 10
+        steam_ids = game_round['PlayerSteamId'].values
+        unchanged = (tick_idx % 2 == 1) & np.isin(steam_ids,
+                                                  np.sort(steam_ids[:10])[:6])
+
+        for column in ['AreaId', 'IsAlive'] + NFL_ATTRIBUTES:
+            values = game_round[column].values.copy()
+            values[unchanged] = values[np.flatnonzero(unchanged) - 10]
+            game_round[column] = values
+
+        multichannel = transform_multichannel(game_round.copy(), game_map)
+        nfl = transform_nfl(game_round.copy(), game_map)
+
+        state = LiveRoundState.from_frame(game_round[tick_idx == 0],
+                                          game_map)
+        features = state.multichannel
+
+        for idx in range(12):
+            state.apply_frame(game_round[(tick_idx == idx) & ~unchanged])
+
+            assert torch.equal(state.multichannel[0], multichannel[idx])
+            assert torch.equal(state.nfl[0], nfl[idx])
+
+        # updated in place
+        assert state.multichannel is features
+        assert state.multichannel.shape == (1, 6, 5, 5)
+        assert state.nfl.shape == (1, 7, 5, 5)
+
+    def test_update(self, game_map, make_round):
+        game_round = make_round(1)
+        state = LiveRoundState.from_frame(game_round, game_map)
+
+        ct_player = state.steam_ids[2]
+        state.update(ct_player, {'AreaId': 7, 'IsAlive': False, 'Hp': 0})
+
+        game_round.loc[game_round['PlayerSteamId'] == ct_player,
+                       ['AreaId', 'IsAlive', 'Hp']] = [7, False, 0]
+
+        assert torch.equal(state.multichannel,
+                           transform_multichannel(game_round, game_map))
+        assert torch.equal(state.nfl, transform_nfl(game_round, game_map))
@@ -0,0 +1,80 @@
+#! /usr/bin/env python3
+
+import pytest
+import torch
+from csgo_wp.model import CNN, FCNN, LR_CNN, NFL_NN, ResNet
+from csgo_wp.optimize import compare_models, optimize_model
+
+
+def _trained_norms(model):
+    # batch norms fresh from the constructor are the identity
+    for module in model.modules():
+        if isinstance(module, torch.nn.modules.batchnorm._BatchNorm):
+            module.running_mean.uniform_(-1, 1)
+            module.running_var.uniform_(0.5, 2)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.5, 0.5)
+
+    return model.eval()
+
+
+# CNN's default conv block pools with a 2x2 kernel
+MODELS = [(CNN, (1, 12, 10)),
+          (FCNN, (1, 12, 10)),
+          (ResNet, (1, 12, 10)),
+          (LR_CNN, (6, 5, 5)),
+          (NFL_NN, (7, 5, 5)),
+          ]
+
+
+class Test_optimize_model:
+
+    @pytest.mark.parametrize('model_class, shape', MODELS)
+    def test_same_outputs(self, model_class, shape):
+        torch.manual_seed(0)
+        model = _trained_norms(model_class(input_size=shape,
+                                           hidden_sizes=[20, 10],
+                                           batch_norm=True,
+                                           dropout=True))
+        x = torch.rand((64,) + shape)
+
+        folded = optimize_model(model, quantize=False)
+        quantized = optimize_model(model)
+
+        with torch.no_grad():
+            torch.testing.assert_close(folded(x), model(x))
+            torch.testing.assert_close(quantized(x), model(x),
+                                       atol=0.02, rtol=0)
+
+        layers = list(folded.modules())
+
+        assert not any(isinstance(layer, torch.nn.modules.dropout._DropoutNd)
+                       for layer in layers)
+
+        # in LinearBlock and ConvBlock, they all fold, the last conv block's
+        # through the flatten into the linear layer
+        if model_class in [CNN, FCNN, LR_CNN]:
+            assert not any(isinstance(layer,
+                                      torch.nn.modules.batchnorm._BatchNorm)
+                           for layer in layers)
+
+        # the batch norm alias forward doesn't use
+        assert not hasattr(folded, 'norm_conv')
+
+        # the original isn't modified
+        assert any(isinstance(layer, torch.nn.modules.dropout._DropoutNd)
+                   for layer in model.modules())
+
+    def test_compare_models(self):
+        torch.manual_seed(0)
+        model = _trained_norms(LR_CNN(hidden_sizes=[20, 10]))
+        features = torch.rand((256, 6, 5, 5))
+        targets = (torch.rand(256) > 0.5).float()
+
+        results = compare_models(model, optimize_model(model),
+                                 features, targets,
+                                 batch_size=64, repeats=1)
+
+        assert abs(results['auc_delta']) < 0.05
+        assert abs(results['log_loss_delta']) < 0.05
+        assert results['speedup'] > 0
@@ -0,0 +1,64 @@
+#! /usr/bin/env python3
+
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from csgo_wp.data_transform import transform_multichannel
+from csgo_wp.ingest import stream_rounds
+from csgo_wp.model import LR_CNN
+from csgo_wp.score import score_frames
+
+
+class Test_score_frames:
+
+    @pytest.mark.parametrize('num_workers', [0, 2])
+    def test_matches_transform(self, raw_folder, tmp_path, num_workers):
+        torch.manual_seed(0)
+        model = LR_CNN(hidden_sizes=[20, 10]).eval()
+        frames_loc = f'{raw_folder}csgo_playerframes_dust2.csv'
+
+        counts = score_frames(frames_loc,
+                              tmp_path / 'predictions.csv',
+                              model,
+                              transform_multichannel,
+                              num_workers=num_workers,
+                              rounds_per_task=5,
+                              batch_size=16,
+                              chunk_size=50,
+                              )
+
+        predictions = pd.read_csv(tmp_path / 'predictions.csv')
+
+        expected = []
+
+        for game_round, is_valid in stream_rounds(frames_loc):
+            if not is_valid:
+                continue
+
+            with torch.no_grad():
+                p_ct = model(transform_multichannel(game_round.copy(),
+                                                    'de_dust2'))
+
+            expected.append(pd.DataFrame({
+                'MatchId': game_round['MatchId'].values[0],
+                'RoundNum': game_round['RoundNum'].values[0],
+                'Tick': np.sort(game_round['Tick'].unique()),
+                'p_ct': p_ct.numpy().reshape(-1),
+            }))
+
+        expected = pd.concat(expected, ignore_index=True)
+
+        assert list(predictions.columns) == ['MatchId', 'RoundNum', 'Tick',
+                                             'p_ct']
+        assert counts == {'rounds': 23,
+                          'ticks': expected.shape[0],
+                          'invalid': 1,
+                          }
+        pd.testing.assert_frame_equal(predictions[['MatchId', 'RoundNum',
+                                                   'Tick']],
+                                      expected[['MatchId', 'RoundNum',
+                                                'Tick']],
+                                      check_dtype=False)
+        np.testing.assert_allclose(predictions['p_ct'], expected['p_ct'],
+                                   rtol=1e-5)
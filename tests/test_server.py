@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+
+import asyncio
+import json
+import torch
+from csgo_wp.data_transform import transform_multichannel
+from csgo_wp.load_test import open_client, request, run_load
+from csgo_wp.model import LR_CNN
+from csgo_wp.server import (MicroBatcher, PredictionServer, MAX_BODY_SIZE,
+                            read_message)
+
+
+def _serve(model, client, **batcher_options):
+    async def main():
+        server = PredictionServer(MicroBatcher(model, **batcher_options),
+                                  default_map='de_test')
+        tcp_server = await server.start(port=0)
+        port = tcp_server.sockets[0].getsockname()[1]
+
+        try:
+            return await client(port)
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+class Test_PredictionServer:
+
+    def test_predictions(self, game_map, make_round):
+        torch.manual_seed(0)
+        model = LR_CNN(hidden_sizes=[20, 10]).eval()
+
+        rounds = [make_round(1, seed) for seed in range(12)]
+        features = torch.cat([transform_multichannel(game_round.copy(),
+                                                     game_map)
+                              for game_round in rounds])
+
+        async def client(port):
+            async def predict(idx):
+                reader, writer = await open_client(port=port)
+
+                if idx % 2:
+                    payload = {'players': rounds[idx][
+                        ['PlayerSteamId', 'Side', 'AreaId', 'IsAlive']
+                    ].to_dict('records')}
+                else:
+                    payload = {'features': features[idx].tolist()}
+
+                response = await request(reader, writer, 'POST', '/predict',
+                                         payload)
+                bad = await request(reader, writer, 'POST', '/predict',
+                                    {'features': [[1, 2]]})
+                writer.close()
+
+                return response, bad
+
+            responses = await asyncio.gather(*[predict(idx)
+                                               for idx in range(12)])
+
+            reader, writer = await open_client(port=port)
+            stats = await request(reader, writer, 'GET', '/stats')
+            writer.close()
+
+            return responses, stats
+
+        responses, (_, stats) = _serve(model, client, max_wait=0.05)
+
+        with torch.no_grad():
+            expected = model(features)
+
+        for idx, ((status, response), (bad_status, _)) in enumerate(
+                responses):
+            assert status == 200 and bad_status == 400
+            assert abs(response['p_ct'] - expected[idx].item()) < 1e-6
+
+        assert stats['requests'] == 12
+        # concurrent requests were batched together
+        assert stats['mean_batch_size'] > 1
+
+    def test_load(self):
+        model = LR_CNN(hidden_sizes=[20, 10]).eval()
+
+        results = _serve(model,
+                         lambda port: run_load(n_feeds=8, duration=0.5,
+                                               port=port),
+                         max_batch=4)
+
+        assert results['requests'] == results['server']['requests'] > 0
+        assert results['p99_ms'] >= results['p50_ms']
+        assert results['server']['mean_batch_size'] <= 4
+
+    def test_bad_players(self, game_map, make_round):
+        model = LR_CNN(hidden_sizes=[20, 10]).eval()
+        players = make_round(1)[['PlayerSteamId', 'Side', 'AreaId',
+                                 'IsAlive']].to_dict('records')
+
+        async def client(port):
+            reader, writer = await open_client(port=port)
+            responses = []
+
+            for area_id, map_name in [(1000, 'de_test'),
+                                      (-1, 'de_test'),
+                                      (1, 'de_nowhere')]:
+                payload = {'players': [dict(player, AreaId=area_id)
+                                       for player in players],
+                           'map': map_name}
+                responses.append(await request(reader, writer, 'POST',
+                                               '/predict', payload))
+
+            # the connection is still usable
+            responses.append(await request(reader, writer, 'POST',
+                                           '/predict', {'players': players}))
+            writer.close()
+
+            return responses
+
+        responses = _serve(model, client)
+
+        assert [status for status, _ in responses] == [400, 400, 400, 200]
+        assert 'AreaId' in responses[0][1]['error']
+        assert 'de_nowhere' in responses[2][1]['error']
+
+    def test_malformed_requests(self):
+        model = LR_CNN(hidden_sizes=[20, 10]).eval()
+
+        async def client(port):
+            responses = []
+
+            for message in [b'POST /predict HTTP/1.1\r\n'
+                            b'Content-Length: many\r\n\r\n',
+                            b'POST /predict HTTP/1.1\r\n'
+                            b'Content-Length: '
+                            + str(MAX_BODY_SIZE + 1).encode()
+                            + b'\r\n\r\n',
+                            b'POST\r\n\r\n']:
+                reader, writer = await open_client(port=port)
+                writer.write(message)
+                await writer.drain()
+
+                start_line, body = await read_message(reader)
+                responses.append((int(start_line.split()[1]),
+                                  json.loads(body)))
+
+                # and the server closed the connection
+                assert await reader.read() == b''
+                writer.close()
+
+            return responses
+
+        responses = _serve(model, client)
+
+        assert [status for status, _ in responses] == [400, 400, 400]
+        assert 'Content-Length' in responses[0][1]['error']
+        assert str(MAX_BODY_SIZE) in responses[1][1]['error']
@@ -0,0 +1,69 @@
+#! /usr/bin/env python3
+
+import pandas as pd
+import torch
+from csgo_wp.ingest import stream_rounds
+from csgo_wp.storage import (save_split, RawSplit, save_tensors, load_tensors,
+                             append_tensors, load_column, TensorBuffer)
+
+
+class Test_RawSplit:
+
+    def test_round_trip(self, raw_folder, tmp_path):
+        rounds = [game_round for game_round, _ in
+                  stream_rounds(raw_folder + 'csgo_playerframes_dust2.csv')]
+
+        save_split(rounds, tmp_path / 'frames')
+        split = RawSplit(tmp_path / 'frames')
+
+        assert len(split) == len(rounds)
+        assert split.keys()[1] == (1, 'de_dust2', 2)
+
+        for expected, game_round in zip(rounds, split):
+            pd.testing.assert_frame_equal(expected.reset_index(drop=True),
+                                          game_round,
+                                          check_categorical=False)
+
+        partial = RawSplit(tmp_path / 'frames', columns=['Tick', 'Side'])
+
+        assert partial[-1].columns.tolist() == ['Tick', 'Side']
+        assert partial.table().shape[0] == sum(r.shape[0] for r in rounds)
+
+
+class Test_TensorStore:
+
+    def test_round_trip(self, tmp_path):
+        data = torch.rand(size=(11, 6, 5, 5))
+        targets = torch.Tensor([0, 1] * 5 + [1])
+
+        save_tensors(data, targets, tmp_path / 'transform_multichannel')
+        loaded_data, loaded_targets = load_tensors(tmp_path
+                                                   / 'transform_multichannel')
+
+        assert torch.equal(loaded_data, data)
+        assert torch.equal(loaded_targets, targets)
+        assert torch.equal(loaded_data[[1, 3]], data[[1, 3]])
+
+    def test_columns(self, tmp_path):
+        data = torch.rand(size=(5, 6, 5, 5))
+        map_index = torch.tensor([0, 0, 1, 1, 2], dtype=torch.int16)
+
+        save_tensors(data[:2], torch.ones(2), tmp_path / 'multi',
+                     columns={'map_index': map_index[:2]})
+        append_tensors(data[2:], torch.zeros(3), tmp_path / 'multi',
+                       columns={'map_index': map_index[2:]})
+
+        loaded = load_column(tmp_path / 'multi', 'map_index')
+
+        assert loaded.dtype == torch.int16
+        assert torch.equal(loaded, map_index)
+        assert torch.equal(load_tensors(tmp_path / 'multi')[0], data)
+
+    def test_buffer(self):
+        chunks = [torch.rand(size=(n, 6, 5, 5)) for n in [3, 1, 9, 4]]
+
+        buffer = TensorBuffer(capacity=2)
+        for chunk in chunks:
+            buffer.extend(chunk)
+
+        assert torch.equal(buffer.tensor(), torch.cat(chunks))
@@ -0,0 +1,93 @@
+#! /usr/bin/env python3
+
+import numpy as np
+import pytest
+import torch
+from csgo_wp import data_transform
+from csgo_wp.storage import RawSplit, save_split
+
+
+class Test_Transforms:
+
+    @pytest.mark.filterwarnings('ignore')
+    @pytest.mark.parametrize('name', ['transform_data',
+                                      'transform_multichannel',
+                                      'transform_nfl',
+                                      ])
+    def test_matches_reference(self, game_map, make_round, name):
+        transform = getattr(data_transform, name)
+        reference = getattr(data_transform, f'{name}_reference')
+
+        for seed, n_ticks in enumerate([1, 7, 25]):
+            game_round = make_round(n_ticks, seed)
+
+            result = transform(game_round.copy(), game_map)
+            expected = reference(game_round.copy(), game_map)
+
+            assert result.dtype == expected.dtype
+            assert torch.equal(result, expected)
+
+    def test_nfl_extra_attributes(self, game_map, make_round):
+        game_round = make_round(5)
+
+        result = data_transform.transform_nfl(game_round, game_map,
+                                              attributes=['Hp', 'X'])
+
+        assert result.shape == (5, 4, 5, 5)
+
+    def test_euclidean_distances(self, game_map, make_round):
+        game_round = make_round(4)
+
+        area = data_transform.transform_multichannel(game_round, game_map)
+        both = data_transform.transform_multichannel(game_round, game_map,
+                                                     distances='both')
+        # no distance table needed
+        euclidean = data_transform.transform_multichannel(
+            game_round, 'de_nowhere', distances='euclidean')
+
+        assert both.shape == (4, 10, 5, 5)
+        assert torch.equal(both[:, :4], area[:, :4])
+        assert torch.equal(both[:, 4:8], euclidean[:, :4])
+        assert torch.equal(both[:, 8:], area[:, 4:])
+        assert torch.equal(euclidean[:, 4:], area[:, 4:])
+
+        # CT player i to T player j, at the first tick
+        first = game_round[game_round['Tick'] == game_round['Tick'].min()]
+        first = first.sort_values(['Side', 'PlayerSteamId'])
+        positions = first[['X', 'Y', 'Z']].values
+        expected = np.linalg.norm(positions[:5, None] - positions[None, 5:],
+                                  axis=2)
+
+        np.testing.assert_allclose(euclidean[0, 3], expected, rtol=1e-6)
+
+        nfl = data_transform.transform_nfl(game_round, game_map,
+                                           distances='both')
+
+        assert nfl.shape == (4, 8, 5, 5)
+        assert torch.equal(nfl[:, :7],
+                           data_transform.transform_nfl(game_round, game_map))
+        assert torch.equal(nfl[:, 7], both[:, 7])
+
+    @pytest.mark.parametrize('stored', [False, True])
+    def test_transform_rounds_workers(self, game_map, make_round, tmp_path,
+                                      stored):
+        rounds = [make_round(3 + seed % 4, seed) for seed in range(7)]
+        ticks = [np.sort(game_round['Tick'].unique())[::2]
+                 for game_round in rounds]
+        game_maps = [game_map] * len(rounds)
+
+        if stored:
+            # read by the workers themselves
+            save_split(rounds, str(tmp_path / 'frames'))
+            rounds = RawSplit(str(tmp_path / 'frames'))
+
+        results = {num_workers: list(data_transform.transform_rounds(
+                       rounds, data_transform.transform_multichannel,
+                       game_maps, ticks=ticks, num_workers=num_workers,
+                       chunk_size=2))
+                   for num_workers in [0, 2]}
+
+        assert [result.shape[0] for result in results[2]] == [
+            len(round_ticks) for round_ticks in ticks]
+        assert all(torch.equal(serial, parallel)
+                   for serial, parallel in zip(results[0], results[2]))